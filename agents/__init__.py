@@ -1,17 +1,24 @@
 """AI Agents — Multi-agent orchestrator with Travel, Financial, and Health agents."""
 
-from agents.llm import LLMConfig, LLMError, call_llm_json
-from agents.orchestrator import orchestrate, classify_query
-from agents.rag import rank_chunks, RankedChunk
+from agents.llm import LLMConfig, LLMError, call_llm_json, call_llm_json_multi
+from agents.orchestrator import Conflict, orchestrate, orchestrate_stream, classify_query
+from agents.rag import rank_cache_clear, rank_cache_info, rank_chunks, rank_chunks_columnar, rank_chunks_multi, RankedChunk
 from agents.runner import run_agent
 
 __all__ = [
     "LLMConfig",
     "LLMError",
     "call_llm_json",
+    "call_llm_json_multi",
     "orchestrate",
+    "orchestrate_stream",
     "classify_query",
+    "Conflict",
+    "rank_cache_clear",
+    "rank_cache_info",
     "rank_chunks",
+    "rank_chunks_columnar",
+    "rank_chunks_multi",
     "RankedChunk",
     "run_agent",
 ]
@@ -1,6 +1,10 @@
 """LLM abstraction — supports Groq, OpenAI-compatible, and stub mode.
 
 Production features:
+- Shared keep-alive HTTP client (connection pooling, HTTP/2 when available)
+- aiohttp transport for concurrent calls (httpx fallback)
+- In-process TTL cache for identical (prompt, payload) calls
+- Optional SSE streaming that stops reading once the JSON object is complete
 - Exponential backoff retry (3 attempts)
 - Structured logging with timing
 - Token-usage tracking
@@ -9,14 +13,22 @@ Production features:
 from __future__ import annotations
 
 import asyncio
+import copy
+import hashlib
+import importlib.util
 import json
 import logging
 import time
 from dataclasses import dataclass, field
-from typing import Any
+from typing import Any, Literal
 
 import httpx
 
+try:  # optional C-accelerated JSON encoder
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
+
 log = logging.getLogger("agents.llm")
 
 
@@ -31,6 +43,10 @@ _PROVIDER_URLS: dict[str, str] = {
 
 _RETRY_CODES = {429, 500, 502, 503, 504}
 
+# HTTP/2 needs the optional `h2` package (installed via httpx[http2])
+_HTTP2 = importlib.util.find_spec("h2") is not None
+_AIOHTTP = importlib.util.find_spec("aiohttp") is not None
+
 
 @dataclass
 class LLMConfig:
@@ -40,9 +56,13 @@ class LLMConfig:
     model: str = "llama-3.3-70b-versatile"
     temperature: float = 0.2
     max_retries: int = 3
+    transport: Literal["httpx", "aiohttp"] = "aiohttp"  # falls back to httpx if aiohttp is missing
+    enable_cache: bool = True
+    stream: bool = False
+    emit_usage: bool = True  # attach result["_usage"]
 
 
-@dataclass
+@dataclass(slots=True)
 class LLMUsage:
     prompt_tokens: int = 0
     completion_tokens: int = 0
@@ -51,9 +71,201 @@ class LLMUsage:
     retries: int = 0
 
 
+# ── Shared HTTP client ────────────────────────────────────────
+_CLIENT: httpx.AsyncClient | None = None
+_CLIENT_LOOP: asyncio.AbstractEventLoop | None = None
+
+
+def _close_on_loop(close, loop: asyncio.AbstractEventLoop | None) -> None:
+    """Close a client superseded by a loop change, on the loop it is bound to.
+
+    If that loop is still running (e.g. another thread's) the close is scheduled
+    there; a closed loop already took the client's transports down with it.
+    """
+    if loop is not None and loop.is_running() and not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(close(), loop)
+
+
+async def get_client() -> httpx.AsyncClient:
+    """Return the shared AsyncClient, creating it lazily.
+
+    The client is bound to the event loop that created it, so a new one is
+    built if the caller runs on a different loop (e.g. per-turn `asyncio.run`);
+    the old one is closed on its own loop.
+    """
+    global _CLIENT, _CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    if _CLIENT is None or _CLIENT.is_closed or _CLIENT_LOOP is not loop:
+        if _CLIENT is not None and not _CLIENT.is_closed:
+            _close_on_loop(_CLIENT.aclose, _CLIENT_LOOP)
+        _CLIENT = httpx.AsyncClient(
+            http2=_HTTP2,
+            timeout=90,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30),
+        )
+        _CLIENT_LOOP = loop
+    return _CLIENT
+
+
+_SESSION = None  # aiohttp.ClientSession
+_SESSION_LOOP: asyncio.AbstractEventLoop | None = None
+
+
+async def get_session():
+    """Return the shared aiohttp ClientSession (same loop rules as `get_client`)."""
+    global _SESSION, _SESSION_LOOP
+    import aiohttp  # type: ignore
+
+    loop = asyncio.get_running_loop()
+    if _SESSION is None or _SESSION.closed or _SESSION_LOOP is not loop:
+        if _SESSION is not None and not _SESSION.closed:
+            _close_on_loop(_SESSION.close, _SESSION_LOOP)
+        _SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, limit_per_host=32, keepalive_timeout=30, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=90),
+        )
+        _SESSION_LOOP = loop
+    return _SESSION
+
+
+async def aclose_client() -> None:
+    """Close the shared client and session (call on app shutdown)."""
+    global _CLIENT, _CLIENT_LOOP, _SESSION, _SESSION_LOOP
+    if _CLIENT is not None and not _CLIENT.is_closed:
+        await _CLIENT.aclose()
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+    _CLIENT = None
+    _CLIENT_LOOP = None
+    _SESSION = None
+    _SESSION_LOOP = None
+
+
+async def _post_json(cfg: LLMConfig, url: str, headers: dict[str, str], body: bytes) -> tuple[int, str]:
+    """POST a pre-serialized JSON body over the configured transport; return (status, text)."""
+    if cfg.transport == "aiohttp" and _AIOHTTP:
+        session = await get_session()
+        async with session.post(url, data=body, headers=headers) as resp:
+            return resp.status, await resp.text()
+    client = await get_client()
+    resp = await client.post(url, headers=headers, content=body)
+    return resp.status_code, resp.text
+
+
+# ── Streaming ─────────────────────────────────────────────────
+class _JSONObjectTracker:
+    """Tracks brace depth across streamed text to spot the end of the top-level object."""
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.in_str = False
+        self.escape = False
+
+    def feed(self, text: str) -> bool:
+        """Consume `text`; return True once the outermost `{...}` has closed."""
+        for ch in text:
+            if self.in_str:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_str = False
+            elif ch == '"':
+                self.in_str = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+async def _read_sse(lines) -> str:
+    """Join the `delta.content` pieces of an OpenAI-style SSE stream."""
+    parts: list[str] = []
+    tracker = _JSONObjectTracker()
+    async for line in lines:
+        line = line.strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        choices = _loads(data).get("choices") or [{}]
+        delta = (choices[0].get("delta") or {}).get("content") or ""
+        parts.append(delta)
+        if tracker.feed(delta):
+            break  # object complete — don't wait for trailing events
+    return "".join(parts)
+
+
+async def _aiohttp_lines(resp):
+    async for raw in resp.content:
+        yield raw.decode("utf-8")
+
+
+async def _post_stream(cfg: LLMConfig, url: str, headers: dict[str, str], body: bytes) -> tuple[int, str]:
+    """POST a streaming request; return (status, assembled content) or (status, error text)."""
+    if cfg.transport == "aiohttp" and _AIOHTTP:
+        session = await get_session()
+        async with session.post(url, data=body, headers=headers) as resp:
+            if resp.status >= 400:
+                return resp.status, await resp.text()
+            return resp.status, await _read_sse(_aiohttp_lines(resp))
+    client = await get_client()
+    async with client.stream("POST", url, headers=headers, content=body) as resp:
+        if resp.status_code >= 400:
+            await resp.aread()
+            return resp.status_code, resp.text
+        return resp.status_code, await _read_sse(resp.aiter_lines())
+
+
+# ── Response cache ────────────────────────────────────────────
+_CACHE_TTL_S = 300.0
+_CACHE_MAX = 256
+_LLM_CACHE: dict[str, tuple[float, dict]] = {}  # key → (stored_at, result)
+
+
+def _cache_get(key: str) -> dict | None:
+    hit = _LLM_CACHE.get(key)
+    if hit is None:
+        return None
+    stored_at, result = hit
+    if time.monotonic() - stored_at > _CACHE_TTL_S:
+        _LLM_CACHE.pop(key, None)
+        return None
+    return copy.deepcopy(result)
+
+
+def _cache_put(key: str, result: dict) -> None:
+    if len(_LLM_CACHE) >= _CACHE_MAX:
+        # Dicts keep insertion order — drop the oldest entry
+        _LLM_CACHE.pop(next(iter(_LLM_CACHE)))
+    _LLM_CACHE[key] = (time.monotonic(), copy.deepcopy(result))
+
+
 # ── JSON helpers ──────────────────────────────────────────────
+def _dumps(obj: Any, *, sort_keys: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys).encode("utf-8")
+
+
+def _loads(data: str | bytes) -> Any:
+    """Parse JSON (orjson when installed; its errors subclass json.JSONDecodeError)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 def _extract_json(text: str) -> dict:
     """Extract JSON from model output, handling markdown code fences."""
+    # Fast path — the model usually honours "no markdown fences"
+    if text[:1] == "{" and text[-1:] == "}":
+        return _loads(text)
     text = text.strip()
     # Strip ```json ... ``` wrapping
     if text.startswith("```"):
@@ -62,7 +274,7 @@ def _extract_json(text: str) -> dict:
         if text.endswith("```"):
             text = text[:-3]
         text = text.strip()
-    return json.loads(text)
+    return _loads(text)
 
 
 # ── Main call ─────────────────────────────────────────────────
@@ -90,47 +302,71 @@ async def call_llm_json(
     base_url = (cfg.base_url or _PROVIDER_URLS[cfg.provider]).rstrip("/")
     url = f"{base_url}/chat/completions"
 
+    # The model sees the payload in the caller's key order
+    input_json = _dumps(payload).decode("utf-8")
+
+    # ── Cache lookup ──────────────────────────────────────────
+    cache_key = ""
+    if cfg.enable_cache:
+        # Sorted only for the key, so equal payloads hit regardless of key order
+        cache_key = hashlib.blake2b(
+            "\x00".join((base_url, cfg.model, repr(cfg.temperature), prompt)).encode("utf-8")
+            + b"\x00"
+            + _dumps(payload, sort_keys=True),
+            digest_size=16,
+        ).hexdigest()
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            log.info("LLM cache hit — model=%s", cfg.model)
+            return cached
+
     messages = [
         {"role": "system", "content": "You output JSON only. No markdown fences."},
         {"role": "user", "content": prompt},
-        {"role": "user", "content": "INPUT_JSON:\n" + json.dumps(payload, ensure_ascii=False)},
+        {"role": "user", "content": "INPUT_JSON:\n" + input_json},
     ]
 
-    body = {
+    request: dict[str, Any] = {
         "model": cfg.model,
         "messages": messages,
         "temperature": cfg.temperature,
         "response_format": {"type": "json_object"},
     }
+    if cfg.stream:
+        request["stream"] = True
+    # Serialized once — retries resend the same bytes
+    body = _dumps(request)
 
     # ── Retry loop with exponential backoff ───────────────────
     usage = LLMUsage()
     last_err: Exception | None = None
     content: str = ""  # track last response content for error reporting
 
-    async with httpx.AsyncClient(timeout=90) as client:
-        for attempt in range(1, cfg.max_retries + 1):
-            t0 = time.perf_counter()
-            try:
-                resp = await client.post(
-                    url,
-                    headers={"Authorization": f"Bearer {cfg.api_key}"},
-                    json=body,
-                )
+    headers = {"Authorization": f"Bearer {cfg.api_key}", "Content-Type": "application/json"}
+    for attempt in range(1, cfg.max_retries + 1):
+        t0 = time.perf_counter()
+        try:
+            if cfg.stream:
+                status, text = await _post_stream(cfg, url, headers, body)
+            else:
+                status, text = await _post_json(cfg, url, headers, body)
 
-                usage.latency_ms = (time.perf_counter() - t0) * 1000
+            usage.latency_ms = (time.perf_counter() - t0) * 1000
 
-                if resp.status_code in _RETRY_CODES and attempt < cfg.max_retries:
-                    wait = 2 ** attempt
-                    log.warning("LLM %d (%s) — retrying in %ds…", resp.status_code, cfg.model, wait)
-                    usage.retries += 1
-                    await asyncio.sleep(wait)
-                    continue
+            if status in _RETRY_CODES and attempt < cfg.max_retries:
+                wait = 2 ** attempt
+                log.warning("LLM %d (%s) — retrying in %ds…", status, cfg.model, wait)
+                usage.retries += 1
+                await asyncio.sleep(wait)
+                continue
 
-                if resp.status_code >= 400:
-                    raise LLMError(f"LLM {resp.status_code}: {resp.text[:500]}")
+            if status >= 400:
+                raise LLMError(f"LLM {status}: {text[:500]}")
 
-                data = resp.json()
+            if cfg.stream:
+                content = text  # streamed responses carry no usage block
+            else:
+                data = _loads(text)
 
                 # Track token usage
                 u = data.get("usage", {})
@@ -139,31 +375,50 @@ async def call_llm_json(
                 usage.total_tokens = u.get("total_tokens", 0)
 
                 content = data["choices"][0]["message"]["content"]
-                result = _extract_json(content)
+            result = _extract_json(content)
 
-                log.info(
-                    "LLM OK — model=%s tokens=%d latency=%.0fms retries=%d",
-                    cfg.model, usage.total_tokens, usage.latency_ms, usage.retries,
-                )
+            log.info(
+                "LLM OK — model=%s tokens=%d latency=%.0fms retries=%d",
+                cfg.model, usage.total_tokens, usage.latency_ms, usage.retries,
+            )
+            if cfg.emit_usage:
                 result["_usage"] = {
                     "tokens": usage.total_tokens,
                     "latency_ms": round(usage.latency_ms),
                     "retries": usage.retries,
                 }
-                return result
-
-            except LLMError:
-                raise
-            except json.JSONDecodeError as e:
-                raise LLMError(f"Invalid JSON from model: {e}. Content: {content[:500]}") from e
-            except Exception as e:
-                last_err = e
-                if attempt < cfg.max_retries:
-                    wait = 2 ** attempt
-                    log.warning("LLM network error (%s) — retry %d in %ds", e, attempt, wait)
-                    usage.retries += 1
-                    await asyncio.sleep(wait)
-                else:
-                    raise LLMError(f"LLM call failed after {cfg.max_retries} attempts: {e}") from e
+            if cfg.enable_cache:
+                _cache_put(cache_key, result)
+            return result
+
+        except LLMError:
+            raise
+        except json.JSONDecodeError as e:
+            raise LLMError(f"Invalid JSON from model: {e}. Content: {content[:500]}") from e
+        except Exception as e:
+            last_err = e
+            if attempt < cfg.max_retries:
+                wait = 2 ** attempt
+                log.warning("LLM network error (%s) — retry %d in %ds", e, attempt, wait)
+                usage.retries += 1
+                await asyncio.sleep(wait)
+            else:
+                raise LLMError(f"LLM call failed after {cfg.max_retries} attempts: {e}") from e
 
     raise LLMError(f"LLM exhausted retries: {last_err}")
+
+
+async def call_llm_json_multi(
+    requests: list[dict[str, Any]], cfg: LLMConfig
+) -> dict[str, dict[str, Any] | BaseException]:
+    """Issue several named calls concurrently over the shared connection pool.
+
+    Each request is `{"name": ..., "prompt": ..., "payload": ...}`. With HTTP/2
+    the calls multiplex over one connection. Failures are returned in place of
+    the result so one bad call does not discard the others.
+    """
+    done = await asyncio.gather(
+        *(call_llm_json(prompt=r["prompt"], payload=r["payload"], cfg=cfg) for r in requests),
+        return_exceptions=True,
+    )
+    return {r["name"]: result for r, result in zip(requests, done)}
@@ -3,26 +3,30 @@
 Production features:
 - Smart query classification to route to relevant agents only
 - Per-stage timing and structured logging
-- Concurrent execution of independent agents
+- Dependency-aware scheduling (health overlaps travel; financial waits on travel)
 - Smart conflict detection across agents
 - Evidence deduplication
 - Total pipeline timing in response metadata
+- `orchestrate_stream` yields each agent's output as soon as it finishes
 """
 from __future__ import annotations
 
 import asyncio
 import logging
 import re
-import time
-from typing import Any
+from time import perf_counter
+from typing import Any, AsyncIterator, Callable, Final, Iterable, NamedTuple
 
 from agents.llm import LLMConfig
-from agents.rag import rank_chunks
+from agents.rag import rank_chunks_multi
 from agents.runner import run_agent
 from agents.web_ingest import fetch_pages
 
 log = logging.getLogger("agents.orchestrator")
 
+# Agent name → evidence topic
+_TOPIC_MAP: Final[dict[str, str]] = {"travel": "travel", "financial": "finance", "health": "health"}
+
 _QUERY_SEEDS = {
     "travel": "travel itinerary hotels destinations budget routes flights trains",
     "finance": "budgeting travel affordability risk tolerance savings",
@@ -30,47 +34,51 @@ _QUERY_SEEDS = {
 }
 
 # ── Query classification ──────────────────────────────────────
-_TRAVEL_PATTERNS = [
-    r"\btrip\b", r"\btravel\b", r"\bflight\b", r"\bfly\b", r"\btrain\b",
-    r"\bbus\b", r"\broute\b", r"\bhotel\b", r"\bstay\b", r"\bbook\b",
-    r"\bitinerary\b", r"\bvisit\b", r"\btour\b", r"\bvacation\b",
-    r"\bfrom\b.*\bto\b", r"\bdestination\b", r"\bhostel\b", r"\bresort\b",
-    r"\bairbnb\b", r"\baccommodation\b", r"\bplan\s+a\s+trip\b",
-]
-
-_HEALTH_PATTERNS = [
-    r"\bdoctor\b", r"\bhealth\b", r"\bmedical\b", r"\bdisease\b",
-    r"\bsymptom\b", r"\btreatment\b", r"\bdiagnos\b", r"\bspecialist\b",
-    r"\bhospital\b", r"\bpain\b", r"\bfever\b", r"\bcough\b",
-    r"\bheart\b", r"\bdiabet\b", r"\bcancer\b", r"\bskin\b",
-    r"\beye\b", r"\bdental\b", r"\bmental\b", r"\bdepression\b",
-    r"\banxiety\b", r"\bwellness\b", r"\bnutrition\b", r"\bdiet\b",
-    r"\bsurger\b", r"\btherapy\b", r"\binfection\b", r"\ballerg\b",
-    r"\bbone\b", r"\bjoint\b", r"\bheadache\b", r"\bmigraine\b",
-    r"\bblood\s*pressure\b", r"\bcholesterol\b", r"\blung\b", r"\bkidney\b",
-]
-
-_FINANCE_PATTERNS = [
-    r"\bbudget\b", r"\bfinance\b", r"\binvest\b", r"\bsaving\b",
-    r"\bmoney\b", r"\bcost\b", r"\bafford\b", r"\bexpense\b",
-    r"\btax\b", r"\bloan\b", r"\binsurance\b", r"\bretirement\b",
-]
+# Plain keywords are matched as whole words against a token set (one pass over
+# the message); only genuinely structural patterns go through a regex.
+_TRAVEL_KEYWORDS = frozenset({
+    "trip", "travel", "flight", "fly", "train", "bus", "route", "hotel", "stay", "book",
+    "itinerary", "visit", "tour", "vacation", "destination", "hostel", "resort",
+    "airbnb", "accommodation",
+})
+_TRAVEL_PATTERNS = [r"\bfrom\b.*\bto\b"]
+
+_HEALTH_KEYWORDS = frozenset({
+    "doctor", "health", "medical", "disease", "symptom", "treatment", "diagnos", "specialist",
+    "hospital", "pain", "fever", "cough", "heart", "diabet", "cancer", "skin",
+    "eye", "dental", "mental", "depression", "anxiety", "wellness", "nutrition", "diet",
+    "surger", "therapy", "infection", "allerg", "bone", "joint", "headache", "migraine",
+    "cholesterol", "lung", "kidney",
+})
+_HEALTH_PATTERNS = [r"\bblood\s*pressure\b"]
+
+_FINANCE_KEYWORDS = frozenset({
+    "budget", "finance", "invest", "saving", "money", "cost", "afford", "expense",
+    "tax", "loan", "insurance", "retirement",
+})
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _fuse(patterns: list[str]) -> re.Pattern[str]:
+    """Compile a pattern list into one case-insensitive alternation (one scan per category)."""
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+
+_TRAVEL_RX = _fuse(_TRAVEL_PATTERNS)
+_HEALTH_RX = _fuse(_HEALTH_PATTERNS)
 
 
 def classify_query(message: str) -> list[str]:
     """Classify user query to determine which agents to run."""
-    msg = message.lower()
     agents = []
+    words = set(_WORD_RE.findall(message.lower()))
     
-    travel_score = sum(1 for p in _TRAVEL_PATTERNS if re.search(p, msg))
-    health_score = sum(1 for p in _HEALTH_PATTERNS if re.search(p, msg))
-    finance_score = sum(1 for p in _FINANCE_PATTERNS if re.search(p, msg))
-    
-    if travel_score >= 1:
+    if not words.isdisjoint(_TRAVEL_KEYWORDS) or _TRAVEL_RX.search(message):
         agents.append("travel")
-    if health_score >= 1:
+    if not words.isdisjoint(_HEALTH_KEYWORDS) or _HEALTH_RX.search(message):
         agents.append("health")
-    if finance_score >= 1:
+    if not words.isdisjoint(_FINANCE_KEYWORDS):
         agents.append("financial")
     
     # If travel is detected, always add financial for budget support
@@ -84,140 +92,217 @@ def classify_query(message: str) -> list[str]:
     return agents
 
 
-def _build_query(topic: str, profile: dict) -> str:
-    base = _QUERY_SEEDS.get(topic, "")
-    extras = " ".join(
+def _profile_extras(profile: dict) -> str:
+    """Profile text appended to every topic's retrieval query (computed once per call)."""
+    return " ".join(
         str(v)
-        for v in [
+        for v in (
             profile.get("message"),
             profile.get("preferences"),
             profile.get("constraints"),
             profile.get("budget"),
-        ]
+        )
         if v
     )
-    return f"{base} {extras}".strip()
+
+
+_MAX_SNIPPETS = 6  # per URL
 
 
 def _to_evidence(chunks) -> list[dict]:
     by_url: dict[str, dict] = {}
+    full: set[str] = set()  # URLs already at the snippet cap
     for ch in chunks:
-        item = by_url.setdefault(ch.url, {"url": ch.url, "title": ch.title, "snippets": []})
-        if len(item["snippets"]) < 6:
-            item["snippets"].append(ch.text)
+        if ch.url in full:
+            continue
+        item = by_url.get(ch.url)
+        if item is None:
+            item = by_url[ch.url] = {"url": ch.url, "title": ch.title, "snippets": []}
+        item["snippets"].append(ch.text)
+        if len(item["snippets"]) >= _MAX_SNIPPETS:
+            full.add(ch.url)
     return list(by_url.values())
 
 
-def _detect_conflicts(results: dict[str, dict]) -> list[str]:
+class Conflict(NamedTuple):
+    """A conflict message tagged with its kind (``affordability``, ``high_risk``, ``low_confidence``)."""
+
+    tag: str
+    message: str
+
+
+# (path into the results, conflict tag, value found there -> conflict message)
+_CONFLICT_RULES: Final[tuple[tuple[tuple[str, ...], str, dict[str, str]], ...]] = (
+    (
+        ("financial", "plan", "travel_affordability_check", "status"),
+        "affordability",
+        {
+            "likely_not_ok": "Financial agent flagged affordability risk — consider cheaper options or extending your savings timeline.",
+            "uncertain": "Financial agent is uncertain about affordability — review the cost breakdown carefully.",
+        },
+    ),
+)
+
+
+def _dig(data: Any, path: tuple[str, ...]) -> Any:
+    """``data[p0][p1]...``, or None as soon as a level is missing or not a dict."""
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _detect_conflicts(results: dict[str, dict]) -> list[Conflict]:
     """Cross-agent conflict detection."""
-    conflicts: list[str] = []
-
-    # Financial affordability check
-    fin = results.get("financial", {})
-    afford = fin.get("plan", {}).get("travel_affordability_check", {})
-    if afford.get("status") == "likely_not_ok":
-        conflicts.append(
-            "Financial agent flagged affordability risk — consider cheaper options or extending your savings timeline."
-        )
-    elif afford.get("status") == "uncertain":
-        conflicts.append(
-            "Financial agent is uncertain about affordability — review the cost breakdown carefully."
-        )
+    conflicts: list[Conflict] = []
 
-    # High-risk items across agents
-    for agent_name, agent_data in results.items():
-        for risk in agent_data.get("risks", []):
-            if isinstance(risk, dict) and risk.get("severity") == "high":
-                conflicts.append(f"{agent_name.title()} flagged high-severity risk: {risk.get('risk', 'unknown')}")
+    # Fixed-path checks (financial affordability)
+    for path, tag, messages in _CONFLICT_RULES:
+        value = _dig(results, path)
+        if isinstance(value, str) and value in messages:
+            conflicts.append(Conflict(tag, messages[value]))
 
-    # Low confidence warnings
+    # High-risk items and low-confidence warnings — one pass per agent
     for agent_name, agent_data in results.items():
+        label = agent_name.title()
+        for risk in agent_data.get("risks") or ():
+            if isinstance(risk, dict) and risk.get("severity") == "high":
+                conflicts.append(Conflict("high_risk", f"{label} flagged high-severity risk: {risk.get('risk', 'unknown')}"))
         conf = agent_data.get("confidence", 1.0)
         if isinstance(conf, (int, float)) and conf < 0.4:
-            conflicts.append(f"{agent_name.title()} agent has low confidence ({conf:.0%}) — may need more evidence.")
+            conflicts.append(
+                Conflict("low_confidence", f"{label} agent has low confidence ({conf:.0%}) — may need more evidence.")
+            )
 
     return conflicts
 
 
+async def _timed(coro) -> tuple[Any, float]:
+    """Await `coro`; return (result or raised exception, elapsed ms) for that task alone."""
+    t0 = perf_counter()
+    try:
+        result = await coro
+    except Exception as exc:
+        result = exc
+    return result, (perf_counter() - t0) * 1000
+
+
+def _agent_output(result: Any) -> dict:
+    """An agent's result, or the error payload stored in its place."""
+    if isinstance(result, BaseException):
+        return {"error": str(result), "confidence": 0.0}
+    return result
+
+
 async def orchestrate(
     *,
     user_profile: dict,
-    allowed_domains: list[str],
+    allowed_domains: Iterable[str],
     seed_urls: list[str],
     retrieval_budget_k: int,
     llm_provider: str,
     llm_base_url: str | None,
     llm_api_key: str | None,
     llm_model: str,
+    active_agents: list[str] | None = None,
+    on_agent_done: Callable[[str, dict], None] | None = None,
+    http_client=None,
 ) -> dict[str, Any]:
-    t_start = time.perf_counter()
+    """Run the pipeline; pass ``active_agents`` if the caller already ran `classify_query`.
+
+    ``on_agent_done(name, output)`` is called as each agent finishes (see `orchestrate_stream`).
+    ``http_client`` is a caller-owned page-fetch client (see `fetch_pages`).
+    """
+    t_start = perf_counter()
     llm = LLMConfig(provider=llm_provider, base_url=llm_base_url, api_key=llm_api_key, model=llm_model)
     timings: dict[str, float] = {}
 
     # ── Stage 0: Classify query ──────────────────────────────
-    message = user_profile.get("message", "")
-    active_agents = classify_query(message)
+    if active_agents is None:
+        active_agents = classify_query(user_profile.get("message", ""))
     log.info("Query classified → agents: %s", active_agents)
 
     # ── Stage 1: fetch pages ──────────────────────────────────
-    t0 = time.perf_counter()
+    t0 = perf_counter()
     pages = []
     if seed_urls:
-        pages = await fetch_pages(seed_urls, allowed_domains, k=retrieval_budget_k)
-    timings["fetch_pages_ms"] = round((time.perf_counter() - t0) * 1000)
+        pages = await fetch_pages(seed_urls, allowed_domains, k=retrieval_budget_k, client=http_client)
+    timings["fetch_pages_ms"] = round((perf_counter() - t0) * 1000)
     log.info("Fetched %d pages in %.0fms", len(pages), timings["fetch_pages_ms"])
 
     # ── Stage 2: RAG ranking ─────────────────────────────────
-    t0 = time.perf_counter()
+    t0 = perf_counter()
     k = min(12, retrieval_budget_k)
     evidence = {}
-    topic_map = {"travel": "travel", "financial": "finance", "health": "health"}
-    for agent_name in active_agents:
-        topic = topic_map.get(agent_name, agent_name)
-        if pages:
-            evidence[topic] = _to_evidence(rank_chunks(_build_query(topic, user_profile), pages, top_k=k))
-        else:
+    topics = list(dict.fromkeys(_TOPIC_MAP.get(a, a) for a in active_agents))
+    if pages:
+        # One batched ranking pass for all topics, off the event loop (blocking model/CPU work)
+        extras = _profile_extras(user_profile)
+        queries = {topic: f"{_QUERY_SEEDS.get(topic, '')} {extras}".strip() for topic in topics}
+        ranked = await asyncio.to_thread(rank_chunks_multi, queries, pages, top_k=k)
+        for topic in topics:
+            evidence[topic] = _to_evidence(ranked[topic])
+    else:
+        for topic in topics:
             evidence[topic] = []
-    timings["rag_rank_ms"] = round((time.perf_counter() - t0) * 1000)
+    timings["rag_rank_ms"] = round((perf_counter() - t0) * 1000)
     log.info("RAG ranking done in %.0fms", timings["rag_rank_ms"])
 
-    # ── Stage 3: Run agents — concurrent where possible ─────────
+    # ── Stage 3: Run agents — scheduled by dependency ──────────
     results: dict[str, dict] = {}
     travel_out = None
+    concurrent_tasks: dict[str, asyncio.Task] = {}
+
+    # Health does not depend on travel — start it straight away so it overlaps the travel call
+    if "health" in active_agents:
+        concurrent_tasks["health"] = asyncio.create_task(
+            _timed(run_agent("health", user_profile=user_profile, evidence=evidence.get("health", []), llm=llm))
+        )
 
-    # Travel must run first (financial depends on it for affordability check)
+    # Travel must run before financial (affordability check uses the travel plan)
+    # A failed travel run is reported like any other agent error; financial then runs without upstream
     if "travel" in active_agents:
-        t0 = time.perf_counter()
-        travel_out = await run_agent("travel", user_profile=user_profile, evidence=evidence.get("travel", []), llm=llm)
-        results["travel"] = travel_out
-        timings["travel_agent_ms"] = round((time.perf_counter() - t0) * 1000)
+        try:
+            result, elapsed_ms = await _timed(
+                run_agent("travel", user_profile=user_profile, evidence=evidence.get("travel", []), llm=llm)
+            )
+        except BaseException:
+            for task in concurrent_tasks.values():
+                task.cancel()
+            raise
+        if isinstance(result, BaseException):
+            log.error("Agent travel failed: %s", result)
+        else:
+            travel_out = result
+        results["travel"] = _agent_output(result)
+        if on_agent_done is not None:
+            on_agent_done("travel", results["travel"])
+        timings["travel_agent_ms"] = round(elapsed_ms)
         log.info("Travel agent done in %.0fms", timings["travel_agent_ms"])
 
-    # Financial and Health can run concurrently (both may use travel_out but are independent of each other)
-    concurrent_tasks: dict[str, asyncio.Task] = {}
-
     if "financial" in active_agents:
         concurrent_tasks["financial"] = asyncio.create_task(
-            run_agent("financial", user_profile=user_profile, evidence=evidence.get("finance", []),
-                       upstream=travel_out, llm=llm)
-        )
-
-    if "health" in active_agents:
-        concurrent_tasks["health"] = asyncio.create_task(
-            run_agent("health", user_profile=user_profile, evidence=evidence.get("health", []),
-                       upstream=travel_out, llm=llm)
+            _timed(run_agent("financial", user_profile=user_profile, evidence=evidence.get("finance", []),
+                             upstream=travel_out, llm=llm))
         )
 
     if concurrent_tasks:
-        t0 = time.perf_counter()
-        done = await asyncio.gather(*concurrent_tasks.values(), return_exceptions=True)
-        for name, result in zip(concurrent_tasks.keys(), done):
+        if on_agent_done is not None:
+            for name, task in concurrent_tasks.items():
+                def _notify(t: asyncio.Task, name: str = name) -> None:
+                    if not t.cancelled():
+                        on_agent_done(name, _agent_output(t.result()[0]))
+                task.add_done_callback(_notify)
+        done = dict(zip(concurrent_tasks, await asyncio.gather(*concurrent_tasks.values())))
+        for name in ("financial", "health"):
+            if name not in done:
+                continue
+            result, elapsed_ms = done[name]
             if isinstance(result, BaseException):
                 log.error("Agent %s failed: %s", name, result)
-                results[name] = {"error": str(result), "confidence": 0.0}
-            else:
-                results[name] = result  # type: ignore[assignment]
-            timings[f"{name}_agent_ms"] = round((time.perf_counter() - t0) * 1000)
+            results[name] = _agent_output(result)
+            timings[f"{name}_agent_ms"] = round(elapsed_ms)
             log.info("%s agent done in %.0fms", name.title(), timings[f"{name}_agent_ms"])
 
     # ── Stage 4: Conflict detection ──────────────────────────
@@ -225,14 +310,34 @@ async def orchestrate(
     if conflicts:
         log.warning("Detected %d cross-agent conflicts", len(conflicts))
 
-    timings["total_ms"] = round((time.perf_counter() - t_start) * 1000)
+    timings["total_ms"] = round((perf_counter() - t_start) * 1000)
     log.info("Pipeline complete in %.0fms", timings["total_ms"])
 
     response: dict[str, Any] = {
         "evidence": evidence,
         "active_agents": active_agents,
-        "conflicts": conflicts,
+        # Messages only: the response contract is a list of strings
+        "conflicts": [c.message for c in conflicts],
         "_meta": {"timings": timings, "pages_fetched": len(pages), "llm_model": llm.model},
     }
     response.update(results)
     return response
+
+
+async def orchestrate_stream(**kwargs: Any) -> AsyncIterator[tuple[str, dict]]:
+    """Run `orchestrate`, yielding ``(agent_name, output)`` as agents finish.
+
+    The last item is ``("result", full_response)``; pipeline errors are re-raised.
+    """
+    queue: asyncio.Queue[tuple[str, dict] | None] = asyncio.Queue()
+    task = asyncio.create_task(
+        orchestrate(**kwargs, on_agent_done=lambda name, out: queue.put_nowait((name, out)))
+    )
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while (item := await queue.get()) is not None:
+            yield item
+        yield "result", await task
+    finally:
+        if not task.done():
+            task.cancel()
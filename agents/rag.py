@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import hashlib
 import logging
+import re
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 from functools import lru_cache
+from typing import Any, NamedTuple
 
 log = logging.getLogger("agents.rag")
 
@@ -16,12 +21,28 @@ class RankedChunk:
 
 
 # ── Model caching (singleton) ────────────────────────────────
+def _use_fp16() -> bool:
+    """Half precision only pays off on GPU; CPU inference stays in FP32."""
+    try:
+        import torch  # type: ignore
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
 @lru_cache(maxsize=1)
 def _get_bi_encoder():
-    """Lazy-load and cache the bi-encoder model (loaded once, reused)."""
+    """Lazy-load and cache the bi-encoder model (loaded once, reused).
+
+    Weights load from safetensors, which are memory-mapped from the HF cache.
+    """
     from sentence_transformers import SentenceTransformer  # type: ignore
     log.info("Loading bi-encoder model (one-time)…")
-    return SentenceTransformer("all-MiniLM-L6-v2")
+    model_kwargs: dict[str, Any] = {"use_safetensors": True}
+    if _use_fp16():
+        import torch  # type: ignore
+        model_kwargs["torch_dtype"] = torch.float16
+    return SentenceTransformer("all-MiniLM-L6-v2", model_kwargs=model_kwargs)
 
 
 @lru_cache(maxsize=1)
@@ -29,89 +50,296 @@ def _get_cross_encoder():
     """Lazy-load and cache the cross-encoder model (loaded once, reused)."""
     from sentence_transformers import CrossEncoder  # type: ignore
     log.info("Loading cross-encoder model (one-time)…")
-    return CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+    model = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+    if _use_fp16():
+        model.model.half()
+    return model
+
+
+def preload_models() -> None:
+    """Load both encoders now instead of on the first request.
+
+    Call in a pre-fork parent (e.g. gunicorn --preload) so workers share the
+    weight pages copy-on-write. Missing optional deps are ignored.
+    """
+    for loader in (_get_bi_encoder, _get_cross_encoder):
+        try:
+            loader()
+        except Exception as exc:
+            log.info("Model preload skipped (%s): %s", loader.__name__, exc)
+
+
+# ── Chunk embedding cache ────────────────────────────────────
+# Keyed by a hash of the chunk text so re-fetched pages skip re-encoding.
+# Stored as float16 (half the memory); upcast to float32 for scoring.
+_EMBED_CACHE_MAX = 4096
+_EMBED_CACHE: OrderedDict[bytes, Any] = OrderedDict()
+_EMBED_LOCK = threading.Lock()
+
+
+def _encode_chunks(model, texts: list[str]):
+    """Encode chunk texts once, reusing embeddings cached by earlier calls (LRU)."""
+    import numpy as np
+
+    keys = [hashlib.blake2b(t.encode("utf-8"), digest_size=16).digest() for t in texts]
+    vecs: list[Any] = [None] * len(texts)
+    missing: list[int] = []
+    with _EMBED_LOCK:
+        for i, key in enumerate(keys):
+            vec = _EMBED_CACHE.get(key)
+            if vec is None:
+                missing.append(i)
+            else:
+                _EMBED_CACHE.move_to_end(key)
+                vecs[i] = vec
+
+    if missing:
+        fresh = model.encode(
+            [texts[i] for i in missing], normalize_embeddings=True, batch_size=64, show_progress_bar=False
+        )
+        with _EMBED_LOCK:
+            for i, vec in zip(missing, np.asarray(fresh, dtype=np.float16)):
+                vecs[i] = vec
+                _EMBED_CACHE[keys[i]] = vec
+            while len(_EMBED_CACHE) > _EMBED_CACHE_MAX:
+                _EMBED_CACHE.popitem(last=False)
+
+    return np.stack(vecs).astype(np.float32)
+
+
+# Any whitespace run containing a line break (the `str.splitlines` boundaries)
+_LINE_BREAK_RE = re.compile(r"\s*[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]\s*")
 
 
 def _chunk_text(text: str, *, max_chars: int = 900) -> list[str]:
-    text = "\n".join(line.strip() for line in text.splitlines() if line.strip())
+    # Single pass equivalent of stripping every line and dropping blank ones
+    text = _LINE_BREAK_RE.sub("\n", text).strip()
     if not text:
         return []
-    chunks: list[str] = []
-    start = 0
-    while start < len(text):
-        end = min(len(text), start + max_chars)
-        chunks.append(text[start:end])
-        start = end
-    return chunks
+    return [text[i : i + max_chars] for i in range(0, len(text), max_chars)]
+
 
+def _top_k_indices(scores, k: int):
+    """Indices of the ``k`` highest scores, best first; ties keep document order.
+
+    Same result as a stable descending sort cut at ``k`` (which tied rows make the
+    cut included), but only the partition point is found with a partial sort.
+    """
+    import numpy as np
+
+    if k < len(scores):
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)[: k - len(above)]
+        idx = np.concatenate((above, tied))
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def _top_k_per_query(
+    chunks: list[tuple[str, str | None, str]], scores, top_k: int
+) -> list[list[RankedChunk]]:
+    """Split an (n_chunks, n_queries) score matrix into per-query top-k lists.
+
+    Uses a partial sort (see `_top_k_indices`) so only the top-k slice is fully ordered.
+    """
+    import numpy as np
+
+    scores = np.asarray(scores)
+    k = min(top_k, scores.shape[0])
+    if k <= 0:
+        return [[] for _ in range(scores.shape[1])]
+    out: list[list[RankedChunk]] = []
+    for col in scores.T:
+        out.append([RankedChunk(*chunks[i], score=float(col[i])) for i in _top_k_indices(col, k).tolist()])
+    return out
+
+
+def _bi_encoder_rank(
+    queries: list[str], chunks: list[tuple[str, str | None, str]], top_k: int
+) -> list[list[RankedChunk]]:
+    """Stage 1 — bi-encoder (SentenceTransformer) ranking.
+
+    All queries are encoded in one batch and scored with a single matmul;
+    chunk embeddings come from the shared cache.
+    """
+    import numpy as np
 
-def _bi_encoder_rank(query: str, chunks: list[tuple[str, str | None, str]], top_k: int) -> list[RankedChunk]:
-    """Stage 1 — bi-encoder (SentenceTransformer) ranking."""
     model = _get_bi_encoder()
-    query_vec = model.encode([query], normalize_embeddings=True)
-    text_vecs = model.encode([c[2] for c in chunks], normalize_embeddings=True)
-    scores = (text_vecs @ query_vec[0]).tolist()
-    ranked = sorted(
-        [RankedChunk(url=u, title=t, text=tx, score=float(s)) for (u, t, tx), s in zip(chunks, scores)],
-        key=lambda x: x.score,
-        reverse=True,
-    )
-    return ranked[:top_k]
-
-
-def _cross_encoder_rerank(query: str, candidates: list[RankedChunk], top_k: int) -> list[RankedChunk]:
-    """Stage 2 — cross-encoder reranking for higher precision (DL technique)."""
+    query_vecs = np.asarray(model.encode(queries, normalize_embeddings=True), dtype=np.float32)
+    text_vecs = _encode_chunks(model, [c[2] for c in chunks])
+    return _top_k_per_query(chunks, text_vecs @ query_vecs.T, top_k)
+
+
+def _cross_encoder_rerank(
+    queries: list[str], candidates: list[list[RankedChunk]], top_k: int
+) -> list[list[RankedChunk]]:
+    """Stage 2 — cross-encoder reranking for higher precision (DL technique).
+
+    Pairs for every query go through one `predict` call, then are split back.
+    """
     try:
         reranker = _get_cross_encoder()
-        pairs = [(query, c.text) for c in candidates]
-        scores = reranker.predict(pairs).tolist()
-        for c, s in zip(candidates, scores):
-            c.score = float(s)
-        candidates.sort(key=lambda x: x.score, reverse=True)
-        return candidates[:top_k]
+        pairs = [(q, c.text) for q, cands in zip(queries, candidates) for c in cands]
+        scores = iter(reranker.predict(pairs, batch_size=64).tolist()) if pairs else iter(())
+        for cands in candidates:
+            for c in cands:
+                c.score = float(next(scores))
+            cands.sort(key=lambda x: x.score, reverse=True)
+        return [cands[:top_k] for cands in candidates]
     except Exception:
         # Cross-encoder not installed — keep bi-encoder order
-        return candidates[:top_k]
+        return [cands[:top_k] for cands in candidates]
 
 
-def _tfidf_rank(query: str, chunks: list[tuple[str, str | None, str]], top_k: int) -> list[RankedChunk]:
+def _tfidf_rank(
+    queries: list[str], chunks: list[tuple[str, str | None, str]], top_k: int
+) -> list[list[RankedChunk]]:
     """Fallback — TF-IDF + cosine similarity (no DL required)."""
     from sklearn.feature_extraction.text import TfidfVectorizer
     from sklearn.metrics.pairwise import cosine_similarity
 
     vectorizer = TfidfVectorizer(stop_words="english", max_features=20000)
     X = vectorizer.fit_transform([c[2] for c in chunks])
-    q = vectorizer.transform([query])
-    sims = cosine_similarity(X, q).reshape(-1)
-    ranked = sorted(
-        [RankedChunk(url=u, title=t, text=tx, score=float(s)) for (u, t, tx), s in zip(chunks, sims)],
-        key=lambda x: x.score,
-        reverse=True,
-    )
-    return ranked[:top_k]
+    Q = vectorizer.transform(queries)
+    return _top_k_per_query(chunks, cosine_similarity(X, Q), top_k)
 
 
-def rank_chunks(query: str, docs: list[dict], *, top_k: int = 12) -> list[RankedChunk]:
-    """Two-stage ranking pipeline:
-       1) Bi-encoder (DL) or TF-IDF fallback for initial retrieval.
-       2) Cross-encoder (DL) reranking for precision.
+def _collect_chunks(docs: tuple[tuple[str, str | None, str], ...]) -> list[tuple[str, str | None, str]]:
+    return [(url, title, ch) for url, title, text in docs for ch in _chunk_text(text)]
+
+
+def rank_chunks_multi(queries: dict[str, str], docs: list[dict], *, top_k: int = 12) -> dict[str, list[RankedChunk]]:
+    """Rank the same docs against several named queries in one batched pass.
+
+    Chunks are built and encoded once; bi-encoder and cross-encoder calls are
+    batched across all queries. Returns `{name: ranked_chunks}`.
+    Repeat calls with the same queries, docs and top_k are served from an LRU
+    (see `rank_cache_info()`).
     """
+    docs_key = tuple((d.get("url", ""), d.get("title"), d.get("text", "")) for d in docs)
+    ranked = _rank_cached(tuple(queries.items()), docs_key, top_k)
+    # Fresh RankedChunk objects per call — callers may re-score or sort them
+    return {name: [RankedChunk(c.url, c.title, c.text, c.score) for c in hits] for name, hits in ranked}
 
-    chunks: list[tuple[str, str | None, str]] = []
-    for doc in docs:
-        url = doc.get("url", "")
-        title = doc.get("title")
-        for ch in _chunk_text(doc.get("text", "")):
-            chunks.append((url, title, ch))
 
-    if not chunks:
-        return []
+# ── Ranking result cache ─────────────────────────────────────
+# Keyed by a blake2b digest of (queries, docs, top_k), so entries never hold
+# the doc texts themselves and lookups don't re-hash or compare them.
+_RANK_CACHE_MAX = 64
+_RANK_CACHE: OrderedDict[bytes, tuple] = OrderedDict()
+_RANK_LOCK = threading.Lock()
+_RANK_STATS = {"hits": 0, "misses": 0}
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+def rank_cache_info() -> CacheInfo:
+    """Hit/miss counters of the `rank_chunks` / `rank_chunks_multi` result cache."""
+    with _RANK_LOCK:
+        return CacheInfo(_RANK_STATS["hits"], _RANK_STATS["misses"], _RANK_CACHE_MAX, len(_RANK_CACHE))
+
+
+def rank_cache_clear() -> None:
+    """Drop all cached rankings and reset the counters."""
+    with _RANK_LOCK:
+        _RANK_CACHE.clear()
+        _RANK_STATS.update(hits=0, misses=0)
+
+
+def _rank_digest(
+    queries: tuple[tuple[str, str], ...], docs_key: tuple[tuple[str, str | None, str], ...], top_k: int
+) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+
+    def feed(field: str | None) -> None:
+        # Length-prefixed so field boundaries can't collide; None is distinct from ""
+        data = b"" if field is None else field.encode("utf-8", "surrogatepass")
+        h.update((-1 if field is None else len(data)).to_bytes(8, "little", signed=True))
+        h.update(data)
+
+    feed(str(top_k))
+    for name, text in queries:
+        feed(name)
+        feed(text)
+    h.update(b"|")
+    for url, title, text in docs_key:
+        feed(url)
+        feed(title)
+        feed(text)
+    return h.digest()
+
+
+def _rank_cached(
+    queries: tuple[tuple[str, str], ...], docs_key: tuple[tuple[str, str | None, str], ...], top_k: int
+) -> tuple[tuple[str, tuple[RankedChunk, ...]], ...]:
+    """`_rank` behind an LRU keyed by `_rank_digest`."""
+    key = _rank_digest(queries, docs_key, top_k)
+    with _RANK_LOCK:
+        ranked = _RANK_CACHE.get(key)
+        if ranked is not None:
+            _RANK_CACHE.move_to_end(key)
+            _RANK_STATS["hits"] += 1
+            return ranked
+        _RANK_STATS["misses"] += 1
+
+    ranked = _rank(queries, docs_key, top_k)
+    with _RANK_LOCK:
+        _RANK_CACHE[key] = ranked
+        while len(_RANK_CACHE) > _RANK_CACHE_MAX:
+            _RANK_CACHE.popitem(last=False)
+    return ranked
+
+
+def _rank(
+    queries: tuple[tuple[str, str], ...], docs_key: tuple[tuple[str, str | None, str], ...], top_k: int
+) -> tuple[tuple[str, tuple[RankedChunk, ...]], ...]:
+    chunks = _collect_chunks(docs_key)
+    if not chunks or not queries:
+        return tuple((name, ()) for name, _ in queries)
+
+    names = [name for name, _ in queries]
+    texts = [text for _, text in queries]
 
     # Stage 1 — initial retrieval (wider net: 3x top_k)
+    k1 = min(len(chunks), top_k * 3)
     try:
-        candidates = _bi_encoder_rank(query, chunks, top_k=min(len(chunks), top_k * 3))
+        candidates = _bi_encoder_rank(texts, chunks, top_k=k1)
     except Exception:
-        candidates = _tfidf_rank(query, chunks, top_k=min(len(chunks), top_k * 3))
+        candidates = _tfidf_rank(texts, chunks, top_k=k1)
 
     # Stage 2 — cross-encoder reranking (precision)
-    return _cross_encoder_rerank(query, candidates, top_k)
+    return tuple(zip(names, map(tuple, _cross_encoder_rerank(texts, candidates, top_k))))
+
+
+def rank_chunks(query: str, docs: list[dict], *, top_k: int = 12) -> list[RankedChunk]:
+    """Two-stage ranking pipeline:
+       1) Bi-encoder (DL) or TF-IDF fallback for initial retrieval.
+       2) Cross-encoder (DL) reranking for precision.
+    """
+    return rank_chunks_multi({"query": query}, docs, top_k=top_k)["query"]
+
+
+def rank_chunks_columnar(query: str, urls, titles, texts, *, top_k: int = 12) -> list[RankedChunk]:
+    """Rank a column-oriented corpus (parallel url/title/text arrays) against one query.
+
+    Each text is scored whole with TF-IDF: one sparse matrix-vector product plus a
+    partial sort, with no per-doc dict access or chunking. Meant for large corpora
+    where `rank_chunks`' DL stages are not wanted.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    if len(texts) == 0 or top_k <= 0:
+        return []
+    vectorizer = TfidfVectorizer(stop_words="english", max_features=20000)
+    D = vectorizer.fit_transform(texts)
+    # Rows are L2-normalized, so the dot product is the cosine similarity
+    scores = (D @ vectorizer.transform([query]).T).toarray().ravel()
+    idx = _top_k_indices(scores, min(top_k, len(scores)))
+    return [RankedChunk(urls[i], titles[i], texts[i], float(scores[i])) for i in idx.tolist()]
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from agents.llm import LLMConfig, call_llm_json
-from agents.prompts import PROMPTS
+from agents.prompts import FINANCIAL_AGENT_PROMPT_V11, HEALTH_AGENT_PROMPT_V11, TRAVEL_AGENT_PROMPT_V11
 
 
 async def run_agent(
@@ -13,7 +13,15 @@ async def run_agent(
     upstream: dict | None = None,
     llm: LLMConfig,
 ) -> dict:
-    prompt = PROMPTS[name]
+    match name:
+        case "travel":
+            prompt = TRAVEL_AGENT_PROMPT_V11
+        case "financial":
+            prompt = FINANCIAL_AGENT_PROMPT_V11
+        case "health":
+            prompt = HEALTH_AGENT_PROMPT_V11
+        case _:
+            raise KeyError(name)
     payload: dict = {"user_profile": user_profile, "evidence": evidence}
     if upstream:
         payload["upstream"] = upstream
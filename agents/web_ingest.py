@@ -1,76 +1,356 @@
 """Bounded web ingestion — concurrent fetching with content-quality filtering.
 
 Production features:
-- asyncio.gather for parallel page fetching
-- Readability extraction with fallback to raw text
-- Content-quality heuristic (min length, link-density filter)
+- asyncio.gather for parallel page fetching, bounded per host and overall
+- Shared keep-alive client with sized connection pool (HTTP/2 when available)
+- gzip / Brotli / zstd response compression when the decoders are installed
+- aiohttp transport for the fan-out (httpx fallback)
+- Readability extraction in a process pool (thread fallback) so parsing overlaps downloads
+- Content-quality heuristic (HTML-only, 2 MB body cap, min length, link-density filter)
+- Jittered-backoff retry on transient transport errors / 429 / 5xx
+- Per-host circuit breaker (skip hosts that keep failing, probe after cooldown)
 - Per-page timing and error logging
 """
 from __future__ import annotations
 
 import asyncio
+import importlib.util
 import logging
-import re
+import multiprocessing
+import os
+import pickle
+import random
 import time
-from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Collection, Iterable, Literal
+from urllib.parse import urlparse, urlsplit
 
 import httpx
-from bs4 import BeautifulSoup
+import lxml.html
 from readability import Document
 
 log = logging.getLogger("agents.web_ingest")
 
 _MIN_TEXT_LEN = 120  # skip pages with less useful content
+_MAX_BODY_BYTES = 2_000_000  # stop reading (and parsing) past this
+_PER_HOST_LIMIT = 4  # concurrent fetches per host
+_GLOBAL_LIMIT = 32  # concurrent fetches per fetch_pages call
+_MAX_RETRIES = 2  # extra attempts for transient failures only
+_RETRY_BACKOFF_S = 0.25  # full-jitter base, capped at 2s
+_RETRY_CODES = {429, 500, 502, 503, 504}
+_BREAKER_THRESHOLD = 5  # consecutive failures before a host is skipped
+_BREAKER_COOLDOWN_S = 60.0  # open period before one probe is let through
 _HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
     "(KHTML, like Gecko) Chrome/124.0 Safari/537.36",
     "Accept": "text/html,application/xhtml+xml",
     "Accept-Language": "en-US,en;q=0.9",
+    # Accept-Encoding is left to each client: httpx and aiohttp both advertise
+    # exactly the decoders installed (gzip/deflate, plus br and zstd via extras).
 }
 
 
+_HTTP2 = importlib.util.find_spec("h2") is not None
+_AIOHTTP = importlib.util.find_spec("aiohttp") is not None
+
+# Errors worth retrying; 4xx responses and parse errors are deterministic
+_TRANSIENT_ERRORS: tuple[type[BaseException], ...] = (httpx.TransportError, asyncio.TimeoutError)
+if _AIOHTTP:
+    import aiohttp  # type: ignore
+
+    _TRANSIENT_ERRORS += (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+
+# ── Shared HTTP client ────────────────────────────────────────
+_CLIENT: httpx.AsyncClient | None = None
+_CLIENT_LOOP: asyncio.AbstractEventLoop | None = None
+
+
+def make_client(*, max_keepalive: int = 50) -> httpx.AsyncClient:
+    """Build a fetch client with the module's timeouts, headers and HTTP/2 setting."""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(30, connect=5),
+        follow_redirects=True,
+        headers=_HEADERS,
+        http2=_HTTP2,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=max_keepalive, keepalive_expiry=30),
+    )
+
+
+def _close_on_loop(close, loop: asyncio.AbstractEventLoop | None) -> None:
+    """Close a client superseded by a loop change, on the (still running) loop it is bound to."""
+    if loop is not None and loop.is_running() and not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(close(), loop)
+
+
+async def get_client() -> httpx.AsyncClient:
+    """Return the shared fetch client, rebuilt (and the old one closed) if the running loop changed."""
+    global _CLIENT, _CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    if _CLIENT is None or _CLIENT.is_closed or _CLIENT_LOOP is not loop:
+        if _CLIENT is not None and not _CLIENT.is_closed:
+            _close_on_loop(_CLIENT.aclose, _CLIENT_LOOP)
+        _CLIENT = make_client()
+        _CLIENT_LOOP = loop
+    return _CLIENT
+
+
+_SESSION = None  # aiohttp.ClientSession
+_SESSION_LOOP: asyncio.AbstractEventLoop | None = None
+
+
+async def get_session():
+    """Return the shared aiohttp fetch session (same loop rules as `get_client`)."""
+    global _SESSION, _SESSION_LOOP
+    loop = asyncio.get_running_loop()
+    if _SESSION is None or _SESSION.closed or _SESSION_LOOP is not loop:
+        if _SESSION is not None and not _SESSION.closed:
+            _close_on_loop(_SESSION.close, _SESSION_LOOP)
+        _SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, limit_per_host=8, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=30, connect=5),
+            headers=_HEADERS,
+        )
+        _SESSION_LOOP = loop
+    return _SESSION
+
+
+# ── HTML parse pool ───────────────────────────────────────────
+_PARSE_POOL: ProcessPoolExecutor | None = None
+_PARSE_IN_THREADS = False  # set once the pool can't start (sandboxed hosts, no /dev/shm, …)
+
+
+def _start_method() -> str:
+    """forkserver where available (safe next to server/model threads), else spawn (e.g. Windows)."""
+    return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _parse_pool() -> ProcessPoolExecutor:
+    """Lazily start the parse pool."""
+    global _PARSE_POOL
+    if _PARSE_POOL is None:
+        _PARSE_POOL = ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            mp_context=multiprocessing.get_context(_start_method()),
+        )
+    return _PARSE_POOL
+
+
+async def aclose_client() -> None:
+    """Close the shared fetch client/session and parse pool (call on app shutdown)."""
+    global _CLIENT, _CLIENT_LOOP, _SESSION, _SESSION_LOOP, _PARSE_POOL
+    if _CLIENT is not None and not _CLIENT.is_closed:
+        await _CLIENT.aclose()
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+    _CLIENT = _CLIENT_LOOP = None
+    _SESSION = _SESSION_LOOP = None
+    if _PARSE_POOL is not None:
+        _PARSE_POOL.shutdown(wait=False, cancel_futures=True)
+        _PARSE_POOL = None
+
+
+# ── Per-host circuit breaker ──────────────────────────────────
+@dataclass(slots=True)
+class _HostBreaker:
+    failures: int = 0
+    opened_at: float = 0.0
+
+
+_BREAKERS: dict[str, _HostBreaker] = {}
+
+
+def _breaker_allows(host: str) -> bool:
+    b = _BREAKERS.get(host)
+    if b is None or b.failures < _BREAKER_THRESHOLD:
+        return True
+    now = time.monotonic()
+    if now - b.opened_at < _BREAKER_COOLDOWN_S:
+        return False
+    b.opened_at = now  # half-open: this call probes, others wait another cooldown
+    return True
+
+
+def _breaker_record(host: str, ok: bool) -> None:
+    if ok:
+        _BREAKERS.pop(host, None)
+        return
+    b = _BREAKERS.setdefault(host, _HostBreaker())
+    b.failures += 1
+    if b.failures >= _BREAKER_THRESHOLD:
+        b.opened_at = time.monotonic()
+
+
 def _domain(url: str) -> str:
     return urlparse(url).netloc.lower()
 
 
-def _allowed(url: str, allowed_domains: list[str]) -> bool:
-    if not allowed_domains:
+def _canonical(url: str) -> str:
+    """Dedup key: lower-cased scheme/host, no fragment or trailing slash."""
+    p = urlsplit(url)
+    key = f"{p.scheme.lower()}://{p.netloc.lower()}{p.path.rstrip('/')}"
+    return f"{key}?{p.query}" if p.query else key
+
+
+def _normalize_domains(allowed_domains: Iterable[str]) -> frozenset[str]:
+    return frozenset(a.lower().lstrip(".") for a in allowed_domains)
+
+
+def _allowed(url: str, allowed: Collection[str]) -> bool:
+    """`allowed` holds normalized domains (see `_normalize_domains`)."""
+    if not allowed:
         return True
     d = _domain(url)
-    clean = [a.lower().lstrip(".") for a in allowed_domains]
-    return any(d == a or d.endswith("." + a) for a in clean)
+    # Walk parent domains (www.who.int → who.int → int): O(labels) set lookups
+    while d:
+        if d in allowed:
+            return True
+        d = d.partition(".")[2]
+    return False
 
 
 def _clean_text(text: str) -> str:
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
+    # str.split() collapses any whitespace run and drops the ends, all in C
+    return " ".join(text.split())
+
+
+def _is_html(content_type: str) -> bool:
+    # A missing Content-Type is given the benefit of the doubt
+    return not content_type or "html" in content_type.lower()
+
+
+async def _read_capped(chunks) -> bytearray:
+    """Drain an async byte iterator into one buffer, stopping at `_MAX_BODY_BYTES`.
+
+    The rest of the body is never read; the buffer is decoded as-is (no bytes() copy).
+    """
+    buf = bytearray()
+    async for chunk in chunks:
+        room = _MAX_BODY_BYTES - len(buf)
+        if len(chunk) >= room:
+            buf += memoryview(chunk)[:room]
+            break
+        buf += chunk
+    return buf
+
+
+def _decode(body: bytes | bytearray, content_type: str) -> str:
+    """Decode once with the header charset (UTF-8 default) — no charset sniffing."""
+    enc = "utf-8"
+    ct = content_type.lower()
+    if "charset=" in ct:
+        enc = ct.split("charset=", 1)[1].split(";", 1)[0].strip().strip('"\'') or "utf-8"
+    try:
+        return body.decode(enc, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+async def _download(client, url: str) -> tuple[int, str | None]:
+    """GET `url` via an httpx client or aiohttp session; return (status, html).
+
+    ``html`` is None for error statuses and non-HTML bodies, which are never read.
+    """
+    if isinstance(client, httpx.AsyncClient):
+        async with client.stream("GET", url) as resp:
+            ct = resp.headers.get("content-type", "")
+            if resp.status_code >= 400 or not _is_html(ct):
+                return resp.status_code, None
+            return resp.status_code, _decode(await _read_capped(resp.aiter_bytes()), ct)
+    async with client.get(url, allow_redirects=True) as resp:
+        ct = resp.headers.get("Content-Type", "")
+        if resp.status >= 400 or not _is_html(ct):
+            return resp.status, None
+        return resp.status, _decode(await _read_capped(resp.content.iter_any()), ct)
 
 
-async def _fetch_one(client: httpx.AsyncClient, url: str) -> dict | None:
+async def _download_with_retry(client, url: str) -> tuple[int, str | None]:
+    """`_download` with up to `_MAX_RETRIES` jittered retries on transient failures."""
+    for attempt in range(_MAX_RETRIES):
+        try:
+            status, html = await _download(client, url)
+            if status not in _RETRY_CODES:
+                return status, html
+            log.info("HTTP %d for %s — retry %d", status, url, attempt + 1)
+        except _TRANSIENT_ERRORS as exc:
+            log.info("Transient error for %s (%s) — retry %d", url, type(exc).__name__, attempt + 1)
+        await asyncio.sleep(random.uniform(0, min(2 ** attempt * _RETRY_BACKOFF_S, 2.0)))
+    return await _download(client, url)
+
+
+def _parse_html(html: str) -> tuple[str | None, str]:
+    """Readability + lxml extraction; top-level so it can run in `_PARSE_POOL`."""
+    doc = Document(html)
+    main_html = doc.summary(html_partial=True)
+    # Space-joined text nodes (like get_text(" ")) so adjacent blocks don't run together
+    text = _clean_text(" ".join(lxml.html.fromstring(main_html).itertext()))
+    return doc.short_title() or None, text
+
+
+def _parse_in_threads_from_now_on(exc: BaseException) -> None:
+    """Give up on the parse pool: shut it down (workers included) and switch to threads."""
+    global _PARSE_IN_THREADS, _PARSE_POOL
+    log.warning("Parse pool unavailable (%s) — parsing in threads from now on", exc)
+    _PARSE_IN_THREADS = True
+    if _PARSE_POOL is not None:
+        _PARSE_POOL.shutdown(wait=False, cancel_futures=True)
+        _PARSE_POOL = None
+
+
+async def _parse_off_loop(html: str) -> tuple[str | None, str]:
+    """Run `_parse_html` in the parse pool, or in a worker thread if the pool is unusable."""
+    if not _PARSE_IN_THREADS:
+        # Construction is guarded on its own: a ValueError here is an unusable start
+        # method, while one from the parse itself is a bad page and must not disable the pool
+        try:
+            pool = _parse_pool()
+        except (OSError, ValueError, NotImplementedError) as exc:
+            _parse_in_threads_from_now_on(exc)
+        else:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, _parse_html, html)
+            except (BrokenProcessPool, OSError, NotImplementedError, pickle.PicklingError) as exc:
+                _parse_in_threads_from_now_on(exc)
+    return await asyncio.to_thread(_parse_html, html)
+
+
+async def _fetch_one(client, url: str) -> dict | None:
     """Fetch a single page, extract readable content."""
-    t0 = time.perf_counter()
+    host = _domain(url)
+    if not _breaker_allows(host):
+        log.info("Skipping %s — circuit open for %s", url, host)
+        return None
+
+    t0 = time.monotonic_ns()
     try:
-        resp = await client.get(url)
-        if resp.status_code >= 400:
-            log.warning("HTTP %d for %s", resp.status_code, url)
+        try:
+            status, html = await _download_with_retry(client, url)
+        except _TRANSIENT_ERRORS:
+            _breaker_record(host, ok=False)
+            raise
+        _breaker_record(host, ok=status not in _RETRY_CODES)
+        if status >= 400:
+            log.warning("HTTP %d for %s", status, url)
+            return None
+        if html is None:
+            log.info("Skipping %s — not HTML", url)
+            return None
+        if len(html) < _MIN_TEXT_LEN:
+            log.info("Skipping %s — body too short (%d chars)", url, len(html))
             return None
 
-        html = resp.text
-        doc = Document(html)
-        main_html = doc.summary(html_partial=True)
-        soup = BeautifulSoup(main_html, "lxml")
-        text = _clean_text(soup.get_text(" "))
-        title = doc.short_title() or None
+        title, text = await _parse_off_loop(html)
 
         if len(text) < _MIN_TEXT_LEN:
             log.info("Skipping %s — too short (%d chars)", url, len(text))
             return None
 
-        elapsed = (time.perf_counter() - t0) * 1000
-        log.info("Fetched %s — %d chars in %.0fms", url, len(text), elapsed)
+        elapsed = (time.monotonic_ns() - t0) // 1_000_000
+        log.info("Fetched %s — %d chars in %dms", url, len(text), elapsed)
         return {"url": url, "title": title, "text": text, "chars": len(text)}
 
-    except httpx.TimeoutException:
+    except (httpx.TimeoutException, asyncio.TimeoutError):
         log.warning("Timeout fetching %s", url)
         return None
     except Exception as exc:
@@ -80,16 +360,31 @@ async def _fetch_one(client: httpx.AsyncClient, url: str) -> dict | None:
 
 async def fetch_pages(
     seed_urls: list[str],
-    allowed_domains: list[str],
+    allowed_domains: Iterable[str],
     *,
     k: int,
+    transport: Literal["httpx", "aiohttp"] = "aiohttp",
+    client=None,
+    max_concurrent: int = _GLOBAL_LIMIT,
 ) -> list[dict]:
-    """Concurrently fetch up to k pages from user-supplied URLs."""
+    """Concurrently fetch up to k pages from user-supplied URLs.
 
+    ``transport="aiohttp"`` (default) falls back to httpx if aiohttp is missing.
+    A caller-owned ``client`` (httpx client or aiohttp session) overrides both.
+    At most ``max_concurrent`` requests are in flight, and `_PER_HOST_LIMIT` per host.
+    """
+
+    allowed = _normalize_domains(allowed_domains)
+    seen: set[str] = set()
     urls: list[str] = []
     for u in seed_urls:
-        if u and u not in urls and _allowed(u, allowed_domains):
-            urls.append(u)
+        if not u:
+            continue
+        canon = _canonical(u)
+        if canon in seen or not _allowed(u, allowed):
+            continue
+        seen.add(canon)
+        urls.append(u)
         if len(urls) >= k:
             break
 
@@ -99,11 +394,19 @@ async def fetch_pages(
 
     log.info("Fetching %d URLs concurrently…", len(urls))
 
-    async with httpx.AsyncClient(
-        timeout=30, follow_redirects=True, headers=_HEADERS
-    ) as client:
-        tasks = [_fetch_one(client, url) for url in urls]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+    if client is None:
+        client = await get_session() if transport == "aiohttp" and _AIOHTTP else await get_client()
+    global_sem = asyncio.Semaphore(max_concurrent)
+    host_sems: dict[str, asyncio.Semaphore] = {}
+
+    async def bounded(url: str) -> dict | None:
+        host_sem = host_sems.setdefault(_domain(url), asyncio.Semaphore(_PER_HOST_LIMIT))
+        # Host slot first: waiting on a busy host must not tie up a global slot
+        async with host_sem, global_sem:
+            return await _fetch_one(client, url)
+
+    tasks = [bounded(url) for url in urls]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
 
     pages: list[dict] = []
     for r in results:
@@ -15,7 +15,7 @@ import json
 import logging
 import os
 import time
-import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -25,27 +25,48 @@ from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
+from agents.llm import aclose_client
 from agents.orchestrator import orchestrate, classify_query
+from agents.rag import preload_models
+from agents.web_ingest import aclose_client as aclose_fetch_client
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
 
 # ── Setup ─────────────────────────────────────────────────────
 ROOT = Path(__file__).resolve().parents[1]
 FRONTEND = ROOT / "frontend"
 load_dotenv(ROOT / ".env")
 
+# Read once — the process environment doesn't change after startup
+_API_KEY = os.environ.get("GROQ_API_KEY") or os.environ.get("LLM_API_KEY")
+_LLM_BASE_URL_ENV = os.environ.get("LLM_BASE_URL")
+_GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
 logging.basicConfig(
     level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s %(levelname)-5s [%(name)s] %(message)s",
     datefmt="%H:%M:%S",
 )
+# Skip per-record pid / thread / process-name lookups (unused by the format above)
+logging.logProcesses = False
+logging.logThreads = False
+logging.logMultiprocessing = False
 log = logging.getLogger("backend")
 
+# Load encoders at import so a pre-forking server (gunicorn --preload) shares them across workers
+if os.environ.get("PRELOAD_MODELS", "").lower() in ("1", "true", "yes"):
+    preload_models()
+
 # Allowed domains for web evidence (broad coverage)
-DOMAINS = [
+DOMAINS = frozenset({
     "who.int", "cdc.gov", "nhs.uk", "mayoclinic.org", "healthline.com",
     "medlineplus.gov", "examine.com", "sleepfoundation.org",
     "investopedia.com", "nerdwallet.com", "bankrate.com", "consumerfinance.gov",
     "lonelyplanet.com", "wikitravel.org", "wikivoyage.org",
-]
+})
 
 _DEFAULT_MODELS = {
     "groq": "llama-3.3-70b-versatile",
@@ -53,26 +74,67 @@ _DEFAULT_MODELS = {
     "stub": "stub",
 }
 
-app = FastAPI(title="AI Agents", version="4.0", docs_url="/api/docs", redoc_url=None)
+
+def _json_bytes(obj) -> bytes:
+    """Serialize to UTF-8 JSON bytes (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered via `_json_bytes`.
+
+    Unlike `fastapi.responses.ORJSONResponse` this still works without orjson
+    installed, and it accepts non-str dict keys like the stdlib fallback does.
+    """
+
+    def render(self, content) -> bytes:
+        return _json_bytes(content)
+
+
+def _sse(obj) -> bytes:
+    """Frame one SSE ``data:`` event."""
+    return b"data: " + _json_bytes(obj) + b"\n\n"
+
+
+# Fixed-payload events are framed once
+_EVT_FETCHING = _sse({"stage": "fetching", "label": "Gathering evidence..."})
+_EVT_DONE = _sse({"stage": "done", "label": "Complete"})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release pooled keep-alive connections
+    await aclose_client()
+    await aclose_fetch_client()
+
+
+app = FastAPI(
+    title="AI Agents", version="4.0", docs_url="/api/docs", redoc_url=None,
+    lifespan=lifespan, default_response_class=ORJSONResponse,
+)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 
 # ── Middleware: request ID + timing ───────────────────────────
 @app.middleware("http")
 async def add_request_meta(request: Request, call_next):
-    rid = str(uuid.uuid4())[:8]
+    rid = os.urandom(4).hex()
     request.state.request_id = rid
-    t0 = time.perf_counter()
+    t0 = time.monotonic_ns()
     try:
         response = await call_next(request)
-        elapsed = round((time.perf_counter() - t0) * 1000)
+        elapsed = (time.monotonic_ns() - t0) // 1_000_000
         response.headers["X-Request-ID"] = rid
         response.headers["X-Response-Time"] = f"{elapsed}ms"
-        log.info("%s %s → %d (%dms) [%s]", request.method, request.url.path, response.status_code, elapsed, rid)
+        if log.isEnabledFor(logging.INFO):  # request.url builds a URL object — skip when muted
+            log.info("%s %s → %d (%dms) [%s]", request.method, request.url.path, response.status_code, elapsed, rid)
         return response
     except Exception as exc:
         log.exception("Unhandled error [%s]: %s", rid, exc)
-        return JSONResponse({"error": str(exc), "request_id": rid}, status_code=500)
+        return ORJSONResponse({"error": str(exc), "request_id": rid}, status_code=500)
 
 
 # ── Models ────────────────────────────────────────────────────
@@ -89,28 +151,26 @@ class ChatRequest(BaseModel):
 # ── Endpoints ─────────────────────────────────────────────────
 @app.get("/api/health")
 def health():
-    has_key = bool(os.environ.get("GROQ_API_KEY") or os.environ.get("LLM_API_KEY"))
     return {
         "ok": True,
         "version": "4.0",
-        "api_key_set": has_key,
+        "api_key_set": bool(_API_KEY),
         "default_provider": "groq",
     }
 
 
 def _resolve_llm_params(req: ChatRequest) -> tuple[str, str, str | None, str | None]:
-    """Resolve LLM provider, model, API key, and base URL from request + env."""
+    """Resolve LLM provider, model, API key, and base URL from request + startup env."""
     provider = req.llm_provider
     model = req.llm_model or _DEFAULT_MODELS.get(provider, "llama-3.3-70b-versatile")
-    api_key = os.environ.get("GROQ_API_KEY") or os.environ.get("LLM_API_KEY")
-    base_url = "https://api.groq.com/openai/v1" if provider == "groq" else os.environ.get("LLM_BASE_URL")
-    return provider, model, api_key, base_url
+    base_url = _GROQ_BASE_URL if provider == "groq" else _LLM_BASE_URL_ENV
+    return provider, model, _API_KEY, base_url
 
 
 @app.post("/api/chat")
 async def chat(req: ChatRequest):
     if not req.get_message():
-        return JSONResponse({"error": "user_profile.message is required"}, status_code=422)
+        return ORJSONResponse({"error": "user_profile.message is required"}, status_code=422)
 
     provider, model, api_key, base_url = _resolve_llm_params(req)
     return await orchestrate(
@@ -129,7 +189,7 @@ async def chat(req: ChatRequest):
 async def chat_stream(req: ChatRequest):
     """SSE endpoint — streams stage progress events, then the full result."""
     if not req.get_message():
-        return JSONResponse({"error": "user_profile.message is required"}, status_code=422)
+        return ORJSONResponse({"error": "user_profile.message is required"}, status_code=422)
 
     async def event_stream():
         provider, model, api_key, base_url = _resolve_llm_params(req)
@@ -138,8 +198,8 @@ async def chat_stream(req: ChatRequest):
         message = req.get_message()
         active_agents = classify_query(message)
 
-        yield f"data: {json.dumps({'stage': 'classifying', 'label': 'Analyzing your query...', 'active_agents': active_agents})}\n\n"
-        yield f"data: {json.dumps({'stage': 'fetching', 'label': 'Gathering evidence...'})}\n\n"
+        yield _sse({"stage": "classifying", "label": "Analyzing your query...", "active_agents": active_agents})
+        yield _EVT_FETCHING
 
         try:
             result = await orchestrate(
@@ -151,11 +211,12 @@ async def chat_stream(req: ChatRequest):
                 llm_base_url=base_url,
                 llm_api_key=api_key,
                 llm_model=model,
+                active_agents=active_agents,  # already classified for the first event
             )
-            yield f"data: {json.dumps({'stage': 'done', 'label': 'Complete'})}\n\n"
-            yield f"data: {json.dumps({'result': result})}\n\n"
+            yield _EVT_DONE
+            yield _sse({"result": result})
         except Exception as exc:
-            yield f"data: {json.dumps({'error': str(exc)})}\n\n"
+            yield _sse({"error": str(exc)})
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
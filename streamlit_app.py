@@ -6,19 +6,43 @@ Calls the orchestrator directly (no FastAPI needed for the UI).
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import html
 import json
 import os
+import queue
+import re
+import threading
 import time
+from collections import OrderedDict
 from pathlib import Path
 
 import streamlit as st
 from dotenv import load_dotenv
 
+try:  # optional C-accelerated JSON encoder
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
+
 # ── Load env ──────────────────────────────────────────────────
 ROOT = Path(__file__).resolve().parent
 load_dotenv(ROOT / ".env")
 
-from agents.orchestrator import orchestrate, classify_query
+from agents.orchestrator import orchestrate_stream, classify_query
+from agents.web_ingest import make_client
+
+
+def _dumps(obj, *, sort_keys: bool = False, indent: bool = False) -> str:
+    """JSON text (orjson when installed); non-JSON values fall back to str()."""
+    if orjson is not None:
+        opts = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            opts |= orjson.OPT_SORT_KEYS
+        if indent:
+            opts |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=str, option=opts).decode()
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys, indent=2 if indent else None, default=str)
 
 # ── Page config ───────────────────────────────────────────────
 st.set_page_config(
@@ -29,7 +53,7 @@ st.set_page_config(
 )
 
 # ── Custom CSS ────────────────────────────────────────────────
-st.markdown("""
+_CSS = """
 <style>
     /* Dark-themed cards */
     .agent-card {
@@ -42,6 +66,13 @@ st.markdown("""
     }
     .agent-card:hover { border-color: #8B5CF6; }
 
+    .card-grid {
+        display: grid;
+        grid-template-columns: repeat(auto-fit, minmax(220px, 1fr));
+        gap: 12px;
+        margin-bottom: 12px;
+    }
+
     .transport-card, .hotel-card, .doctor-card {
         background: #1a1a2e;
         border: 1px solid #2a2a3e;
@@ -71,6 +102,21 @@ st.markdown("""
         margin: 3px;
     }
 
+    .day-block {
+        background: #1a1a2e;
+        border: 1px solid #2a2a3e;
+        border-radius: 12px;
+        padding: 10px 16px;
+        margin-bottom: 8px;
+    }
+    .day-block summary { cursor: pointer; font-weight: 700; }
+    .day-note {
+        background: #3b82f622;
+        border-radius: 8px;
+        padding: 8px 12px;
+        font-size: 13px;
+    }
+
     .disclaimer-box {
         background: #f9731622;
         border: 1px solid #f9731644;
@@ -104,7 +150,22 @@ st.markdown("""
 
     div[data-testid="stMetricValue"] { font-size: 18px; }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+
+@st.cache_resource
+def _css_block() -> str:
+    """Minify `_CSS` once per server process.
+
+    The block must still be emitted on every rerun (elements not re-sent are
+    removed), so the win is a smaller per-rerun delta, not skipping it.
+    """
+    css = re.sub(r"/\*.*?\*/", "", _CSS, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{}:;,>])\s*", r"\1", css).strip()
+
+
+st.markdown(_css_block(), unsafe_allow_html=True)
 
 # ── Mode icons ────────────────────────────────────────────────
 MODE_ICONS = {
@@ -117,36 +178,125 @@ MODE_ICONS = {
 }
 
 
+# One compiled pattern, alternatives tried in MODE_ICONS order (first key wins, as
+# before). Leading \b only: "chair" is not "air", but "flights"/"airline" still match.
+_MODE_RE = re.compile(
+    "|".join(rf"(?=.*?\b(?P<m{i}>{re.escape(key)}))" for i, key in enumerate(MODE_ICONS)), re.I | re.S
+)
+
+
 def get_mode_icon(mode: str) -> str:
-    m = (mode or "").lower()
-    for key, icon in MODE_ICONS.items():
-        if key in m:
-            return icon
-    return "🚀"
+    m = _MODE_RE.match(mode or "")
+    return MODE_ICONS[m.group(m.lastgroup).lower()] if m else "🚀"
 
 
 # ── Async helper ──────────────────────────────────────────────
-def run_async(coro):
-    """Run an async coroutine from sync Streamlit context."""
+@st.cache_resource
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """One event loop for the whole server, on a daemon thread (uvloop when installed).
+
+    Cached as a resource so it survives script reruns — keep-alive pools in the
+    LLM / fetch clients stay bound to it across chat turns.
+    """
     try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                return pool.submit(asyncio.run, coro).result()
-        else:
-            return loop.run_until_complete(coro)
-    except RuntimeError:
-        return asyncio.run(coro)
+        import uvloop  # type: ignore
+        loop = uvloop.new_event_loop()
+    except ImportError:
+        loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="orchestrator-loop", daemon=True).start()
+    return loop
+
+
+@st.cache_resource
+def get_http_client():
+    """Page-fetch client shared by all sessions; its pool lives on `_background_loop`."""
+    return make_client(max_keepalive=32)
+
+
+def stream_async(agen):
+    """Iterate an async generator on the background loop from sync Streamlit code."""
+    items: queue.Queue = queue.Queue()
+    end = object()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        except Exception as exc:
+            items.put(exc)
+        finally:
+            items.put(end)
+
+    asyncio.run_coroutine_threadsafe(pump(), _background_loop())
+    while (item := items.get()) is not end:
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+# ── Result memo (shared across sessions) ──────────────────────
+# A plain TTL store rather than st.cache_data: streamed runs fill it once they finish.
+_RESULT_TTL_S = 3600
+_RESULT_MAX = 128
+
+
+@st.cache_resource
+def _result_store() -> tuple[OrderedDict, threading.Lock]:
+    return OrderedDict(), threading.Lock()
+
+
+def _result_key(profile: dict, seed_urls: list[str], provider: str, model: str,
+                base_url: str | None, api_key: str | None) -> str:
+    """Digest of everything that shapes a run; the API key only as a fingerprint."""
+    key_fp = hashlib.blake2b((api_key or "").encode(), digest_size=8).hexdigest()
+    raw = _dumps([profile, seed_urls, provider, model, base_url, key_fp], sort_keys=True)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def _cached_result(key: str) -> dict | None:
+    store, lock = _result_store()
+    with lock:
+        hit = store.get(key)
+        if hit is None:
+            return None
+        if time.monotonic() - hit[0] > _RESULT_TTL_S:
+            del store[key]
+            return None
+        store.move_to_end(key)
+        return hit[1]
+
+
+def _is_degraded(result: dict) -> bool:
+    """True if any agent failed or came back with low confidence — likely transient, don't share it."""
+    for name in ("travel", "financial", "health"):
+        out = result.get(name)
+        if not isinstance(out, dict):
+            continue
+        conf = out.get("confidence")
+        if "error" in out or (isinstance(conf, (int, float)) and conf < 0.4):
+            return True
+    return False
+
+
+def _store_result(key: str, result: dict) -> None:
+    """Memoize a healthy run; degraded runs are shown once and retried next time."""
+    if _is_degraded(result):
+        return
+    store, lock = _result_store()
+    with lock:
+        store[key] = (time.monotonic(), result)
+        store.move_to_end(key)
+        while len(store) > _RESULT_MAX:
+            store.popitem(last=False)
 
 
 # ── Allowed domains ───────────────────────────────────────────
-DOMAINS = [
+DOMAINS = frozenset({
     "who.int", "cdc.gov", "nhs.uk", "mayoclinic.org", "healthline.com",
     "medlineplus.gov", "examine.com", "sleepfoundation.org",
     "investopedia.com", "nerdwallet.com", "bankrate.com", "consumerfinance.gov",
     "lonelyplanet.com", "wikitravel.org", "wikivoyage.org",
-]
+})
 
 DEFAULT_MODELS = {
     "groq": "llama-3.3-70b-versatile",
@@ -157,7 +307,10 @@ DEFAULT_MODELS = {
 # ══════════════════════════════════════════════════════════════
 # SIDEBAR
 # ══════════════════════════════════════════════════════════════
-with st.sidebar:
+# A fragment: editing settings reruns only the sidebar, not the chat history.
+# Values are read from st.session_state when a query is sent.
+@st.fragment
+def _sidebar():
     st.markdown("### 🤖 AI Smart Assistant")
     st.caption("v5.0 — Streamlit Edition")
     st.divider()
@@ -237,11 +390,140 @@ with st.sidebar:
     st.caption(f"{status} · Smart Routing · RAG · DL Reranking")
 
 
+with st.sidebar:
+    _sidebar()
+
+
 # ══════════════════════════════════════════════════════════════
 # RENDERERS
 # ══════════════════════════════════════════════════════════════
 
-def render_travel(data: dict):
+_HTML_MEMO_MAX = 256
+
+
+def _memo_html(digest: str | None, section: str, build) -> str:
+    """HTML for one section of a result, built once per content hash and reused on reruns.
+
+    ``digest`` identifies the result's content (see `_add_message`); None (in-flight
+    cards) always builds.
+    """
+    if digest is None:
+        return build()
+    memo = st.session_state.setdefault("_html_memo", OrderedDict())
+    k = f"{digest}:{section}"
+    html = memo.get(k)
+    if html is None:
+        html = memo[k] = build()
+        while len(memo) > _HTML_MEMO_MAX:
+            memo.popitem(last=False)
+    return html
+
+
+def _card_grid(cards) -> str:
+    """One HTML block for a whole card list — a single st.markdown call per grid."""
+    return f'<div class="card-grid">{"".join(cards)}</div>'
+
+
+class _Fields(dict):
+    """format_map mapping over HTML-escaped field values; fields absent from the agent's output render as ''.
+
+    Agent output is untrusted text rendered with ``unsafe_allow_html``, so every
+    value is escaped (quotes included — some land in attributes).
+    """
+
+    def __init__(self, fields: dict):
+        super().__init__((k, html.escape(str(v), quote=True)) for k, v in fields.items())
+
+    def __missing__(self, key: str) -> str:
+        return ""
+
+
+# Card templates are built once; each card is a single format_map over the item's fields
+_TRANSPORT_TPL = (
+    '<div class="transport-card">'
+    "<h4>{icon} {mode}</h4>"
+    "<p>⏱ {duration}</p>"
+    '<h3 style="color:#10b981">{estimated_cost}</h3>'
+    '<p style="font-size:12px;color:#888">{details}</p>'
+    '<a href="{booking_link}" target="_blank" class="book-link blue">🔍 Search & Book →</a>'
+    "</div>"
+)
+_TRANSPORT_DEFAULTS = {"mode": "Transport", "duration": "N/A", "estimated_cost": "Check link", "booking_link": "#"}
+
+_HOTEL_TPL = (
+    '<div class="hotel-card">'
+    "<h4>{name}</h4>"
+    '<span style="background:#8B5CF622;color:#8B5CF6;padding:2px 8px;border-radius:6px;font-size:11px">{type}</span>'
+    "<p>📍 {area}</p>"
+    '<h3 style="color:#10b981">{price_per_night}/night</h3>'
+    '<p style="font-size:12px;color:#888">{why}</p>'
+    '<a href="{booking_link}" target="_blank" class="book-link purple">🔍 Search & Book →</a>'
+    "</div>"
+)
+_HOTEL_DEFAULTS = {"name": "Hotel", "type": "hotel", "area": "Central", "price_per_night": "Check link", "booking_link": "#"}
+
+_COST_TPL = (
+    '<div class="cost-card" title="{assumptions}">'
+    '<p style="font-size:13px;color:#888;margin:0">{category}</p>'
+    '<h3 style="margin:4px 0 0">{estimate}</h3>'
+    "</div>"
+)
+_COST_DEFAULTS = {"estimate": "—"}
+
+_DOCTOR_TPL = (
+    '<div class="doctor-card">'
+    '<div style="text-align:right"><span style="background:linear-gradient(135deg,#ec4899,#db2777);color:white;border-radius:50%;width:28px;height:28px;display:inline-flex;align-items:center;justify-content:center;font-size:12px;font-weight:800">#{rank}</span></div>'
+    "<h4>{name}</h4>"
+    '<span style="background:#ec489922;color:#ec4899;padding:3px 10px;border-radius:6px;font-size:11px">{specialty}</span>'
+    "<p>🏥 {hospital}</p>"
+    "<p>📍 {location}</p>"
+    '<p style="font-size:12px;color:#888;border-top:1px solid #2a2a3e;padding-top:8px;margin-top:8px">{why_recommended}</p>'
+    '<a href="{link}" target="_blank" class="book-link pink">🔍 Find & Book →</a>'
+    "</div>"
+)
+_DOCTOR_DEFAULTS = {"name": "Doctor", "specialty": "Specialist", "hospital": "Hospital"}
+
+
+def _transport_card(opt: dict) -> str:
+    icon = get_mode_icon(opt.get("mode", ""))
+    return _TRANSPORT_TPL.format_map(_Fields({**_TRANSPORT_DEFAULTS, **opt, "icon": icon}))
+
+
+def _hotel_card(h: dict) -> str:
+    return _HOTEL_TPL.format_map(_Fields({**_HOTEL_DEFAULTS, **h}))
+
+
+def _cost_card(c: dict) -> str:
+    return _COST_TPL.format_map(_Fields({**_COST_DEFAULTS, **c}))
+
+
+def _doctor_card(rank: int, doc: dict) -> str:
+    link = doc.get("search_link") or doc.get("booking_link", "#")
+    return _DOCTOR_TPL.format_map(_Fields({**_DOCTOR_DEFAULTS, **doc, "rank": rank, "link": link}))
+
+
+@st.fragment
+def _raw_json(data: dict, key: str):
+    """Raw result payload, serialized only once the user asks for it."""
+    if st.checkbox("📄 Show raw JSON", key=f"rj_{key}"):
+        st.code(_dumps(data, indent=True), language="json")
+
+
+_DAY_SLOTS = (("morning", "🌅", "Morning"), ("afternoon", "☀️", "Afternoon"), ("evening", "🌙", "Evening"))
+
+
+def _day_block(d: dict) -> str:
+    """One itinerary day as a native <details> block (collapsible without a widget)."""
+    esc = html.escape
+    parts = [f'<details class="day-block" open><summary>Day {esc(str(d.get("day", "?")))}</summary>']
+    parts += [f"<p>{icon} <b>{label}:</b> {esc(str(d[slot]))}</p>" for slot, icon, label in _DAY_SLOTS if d.get(slot)]
+    if d.get("notes"):
+        parts.append(f'<p class="day-note">💡 {esc(str(d["notes"]))}</p>')
+    parts.append("</details>")
+    return "".join(parts)
+
+
+def render_travel(data: dict, key: str | None = None, digest: str | None = None):
     """Render travel agent results."""
     plan = data.get("plan", {})
 
@@ -269,65 +551,25 @@ def render_travel(data: dict):
     transport = plan.get("transport_options", [])
     if transport:
         st.markdown("#### 🚀 Best Ways to Reach")
-        cols = st.columns(min(len(transport), 3))
-        for i, opt in enumerate(transport):
-            with cols[i % len(cols)]:
-                icon = get_mode_icon(opt.get("mode", ""))
-                st.markdown(f"""
-                <div class="transport-card">
-                    <h4>{icon} {opt.get('mode', 'Transport')}</h4>
-                    <p>⏱ {opt.get('duration', 'N/A')}</p>
-                    <h3 style="color:#10b981">{opt.get('estimated_cost', 'Check link')}</h3>
-                    <p style="font-size:12px;color:#888">{opt.get('details', '')}</p>
-                    <a href="{opt.get('booking_link', '#')}" target="_blank" class="book-link blue">🔍 Search & Book →</a>
-                </div>
-                """, unsafe_allow_html=True)
+        st.markdown(_memo_html(digest, "transport", lambda: _card_grid(map(_transport_card, transport))), unsafe_allow_html=True)
 
     # Hotels
     hotels = plan.get("hotels", [])
     if hotels:
         st.markdown("#### 🏨 Hotels & Stays")
-        cols = st.columns(min(len(hotels), 3))
-        for i, h in enumerate(hotels):
-            with cols[i % len(cols)]:
-                st.markdown(f"""
-                <div class="hotel-card">
-                    <h4>{h.get('name', 'Hotel')}</h4>
-                    <span style="background:#8B5CF622;color:#8B5CF6;padding:2px 8px;border-radius:6px;font-size:11px">{h.get('type', 'hotel')}</span>
-                    <p>📍 {h.get('area', 'Central')}</p>
-                    <h3 style="color:#10b981">{h.get('price_per_night', 'Check link')}/night</h3>
-                    <p style="font-size:12px;color:#888">{h.get('why', '')}</p>
-                    <a href="{h.get('booking_link', '#')}" target="_blank" class="book-link purple">🔍 Search & Book →</a>
-                </div>
-                """, unsafe_allow_html=True)
+        st.markdown(_memo_html(digest, "hotels", lambda: _card_grid(map(_hotel_card, hotels))), unsafe_allow_html=True)
 
     # Itinerary
     days = plan.get("itinerary_by_day", [])
     if days:
         st.markdown("#### 📅 Day-by-Day Itinerary")
-        for d in days:
-            with st.expander(f"Day {d.get('day', '?')}", expanded=True):
-                if d.get("morning"):
-                    st.markdown(f"🌅 **Morning:** {d['morning']}")
-                if d.get("afternoon"):
-                    st.markdown(f"☀️ **Afternoon:** {d['afternoon']}")
-                if d.get("evening"):
-                    st.markdown(f"🌙 **Evening:** {d['evening']}")
-                if d.get("notes"):
-                    st.info(f"💡 {d['notes']}")
+        st.markdown(_memo_html(digest, "days", lambda: "".join(map(_day_block, days))), unsafe_allow_html=True)
 
     # Cost breakdown
     costs = plan.get("estimated_cost_breakdown", [])
     if costs:
         st.markdown("#### 💰 Estimated Cost Breakdown")
-        cols = st.columns(min(len(costs), 4))
-        for i, c in enumerate(costs):
-            with cols[i % len(cols)]:
-                st.metric(
-                    label=c.get("category", ""),
-                    value=c.get("estimate", "—"),
-                    help=c.get("assumptions", ""),
-                )
+        st.markdown(_memo_html(digest, "costs", lambda: _card_grid(map(_cost_card, costs))), unsafe_allow_html=True)
 
     # Travel tips
     tips = plan.get("travel_tips", [])
@@ -339,12 +581,11 @@ def render_travel(data: dict):
     # Risks
     render_risks(data.get("risks", []))
 
-    # Raw JSON
-    with st.expander("📄 Raw JSON"):
-        st.json(data)
+    if key is not None:
+        _raw_json(data, key)
 
 
-def render_health(data: dict):
+def render_health(data: dict, key: str | None = None, digest: str | None = None):
     """Render health agent results."""
     plan = data.get("plan", {})
 
@@ -367,21 +608,10 @@ def render_health(data: dict):
     doctors = plan.get("top_doctors", [])
     if doctors:
         st.markdown(f"#### 👨‍⚕️ Top {len(doctors)} Recommended Specialists")
-        cols = st.columns(min(len(doctors), 3))
-        for i, doc in enumerate(doctors):
-            with cols[i % len(cols)]:
-                link = doc.get("search_link") or doc.get("booking_link", "#")
-                st.markdown(f"""
-                <div class="doctor-card">
-                    <div style="text-align:right"><span style="background:linear-gradient(135deg,#ec4899,#db2777);color:white;border-radius:50%;width:28px;height:28px;display:inline-flex;align-items:center;justify-content:center;font-size:12px;font-weight:800">#{i+1}</span></div>
-                    <h4>{doc.get('name', 'Doctor')}</h4>
-                    <span style="background:#ec489922;color:#ec4899;padding:3px 10px;border-radius:6px;font-size:11px">{doc.get('specialty', 'Specialist')}</span>
-                    <p>🏥 {doc.get('hospital', 'Hospital')}</p>
-                    <p>📍 {doc.get('location', '')}</p>
-                    <p style="font-size:12px;color:#888;border-top:1px solid #2a2a3e;padding-top:8px;margin-top:8px">{doc.get('why_recommended', '')}</p>
-                    <a href="{link}" target="_blank" class="book-link pink">🔍 Find & Book →</a>
-                </div>
-                """, unsafe_allow_html=True)
+        st.markdown(
+            _memo_html(digest, "doctors", lambda: _card_grid(_doctor_card(i, doc) for i, doc in enumerate(doctors, 1))),
+            unsafe_allow_html=True,
+        )
 
     # Health guidance sections
     guidance = plan.get("health_guidance", {})
@@ -429,11 +659,11 @@ def render_health(data: dict):
     # Risks
     render_risks(data.get("risks", []))
 
-    with st.expander("📄 Raw JSON"):
-        st.json(data)
+    if key is not None:
+        _raw_json(data, key)
 
 
-def render_financial(data: dict):
+def render_financial(data: dict, key: str | None = None, digest: str | None = None):
     """Render financial agent results."""
     plan = data.get("plan", {})
 
@@ -455,7 +685,7 @@ def render_financial(data: dict):
         with st.expander("📊 Budget Summary", expanded=True):
             if isinstance(budget, dict):
                 for k, v in budget.items():
-                    st.markdown(f"**{k}:** {v if not isinstance(v, dict) else json.dumps(v)}")
+                    st.markdown(f"**{k}:** {v if not isinstance(v, dict) else _dumps(v)}")
             elif isinstance(budget, list):
                 for item in budget:
                     st.markdown(f"- {item}")
@@ -483,37 +713,53 @@ def render_financial(data: dict):
     if controls:
         with st.expander("💡 Cost-Saving Tips", expanded=True):
             for c in controls:
-                st.markdown(f"- {c if isinstance(c, str) else json.dumps(c)}")
+                st.markdown(f"- {c if isinstance(c, str) else _dumps(c)}")
 
     # Financial priorities
     priorities = plan.get("financial_priorities_framework", [])
     if priorities:
         with st.expander("🎯 Financial Priorities Framework"):
             for p in priorities:
-                st.markdown(f"- {p if isinstance(p, str) else json.dumps(p)}")
+                st.markdown(f"- {p if isinstance(p, str) else _dumps(p)}")
 
     # Risks
     render_risks(data.get("risks", []))
 
-    with st.expander("📄 Raw JSON"):
-        st.json(data)
+    if key is not None:
+        _raw_json(data, key)
+
+
+_SEV_ICON = {"high": "🔴", "medium": "🟡", "low": "🟢"}
 
 
 def render_risks(risks: list):
     """Render risk items."""
     if not risks:
         return
+    lines = []
+    for r in risks:
+        if isinstance(r, str):
+            lines.append(f"- {r}")
+        elif isinstance(r, dict):
+            severity = r.get("severity", "low")
+            lines.append(
+                f"- {_SEV_ICON.get(severity, '⚪')} **{severity.upper()}** — {r.get('risk', '')} → _{r.get('mitigation', '')}_"
+            )
     with st.expander("⚠️ Risks & Warnings"):
-        for r in risks:
-            if isinstance(r, str):
-                st.markdown(f"- {r}")
-            elif isinstance(r, dict):
-                severity = r.get("severity", "low")
-                icon = {"high": "🔴", "medium": "🟡", "low": "🟢"}.get(severity, "⚪")
-                st.markdown(f"{icon} **{severity.upper()}** — {r.get('risk', '')} → _{r.get('mitigation', '')}_")
+        st.markdown("\n".join(lines))
+
+
+_AGENT_RENDERERS = {"travel": render_travel, "financial": render_financial, "health": render_health}
+_AGENT_ICONS = {"travel": "✈️", "financial": "💰", "health": "🩺"}
+
 
+@st.fragment
+def _agent_panel(name: str, data: dict, key: str, digest: str | None):
+    """One agent's tab — interactions inside rerun only this panel."""
+    _AGENT_RENDERERS[name](data, key=f"{key}_{name}", digest=digest and f"{digest}:{name}")
 
-def render_result(result: dict):
+
+def render_result(result: dict, key: str, digest: str | None = None):
     """Render the full orchestrator result."""
     # Meta / timing
     meta = result.get("_meta", {})
@@ -527,35 +773,30 @@ def render_result(result: dict):
     # Active agents
     active = result.get("active_agents", [])
     if active:
-        icons = {"travel": "✈️", "financial": "💰", "health": "🩺"}
-        agent_tags = " · ".join(f"{icons.get(a, '🤖')} **{a.title()}**" for a in active)
+        agent_tags = " · ".join(f"{_AGENT_ICONS.get(a, '🤖')} **{a.title()}**" for a in active)
         st.markdown(f"Active agents: {agent_tags}")
 
     # Evidence sources
-    urls = set()
-    evidence = result.get("evidence", {})
-    for bucket in evidence.values():
-        for item in (bucket or []):
-            if isinstance(item, dict) and item.get("url"):
-                urls.add(item["url"])
+    # Deduped in first-seen order (a set would reshuffle on every rerun)
+    urls = list(dict.fromkeys(
+        item["url"]
+        for bucket in result.get("evidence", {}).values()
+        for item in (bucket or [])
+        if isinstance(item, dict) and item.get("url")
+    ))
     if urls:
         with st.expander(f"📚 Evidence Sources ({len(urls)})"):
-            for u in urls:
-                st.markdown(f"[{u}]({u})")
+            st.markdown("\n".join(f"- [{u}]({u})" for u in urls))
 
     st.divider()
 
-    # Render each agent
-    if result.get("travel"):
-        render_travel(result["travel"])
-        st.divider()
-
-    if result.get("financial"):
-        render_financial(result["financial"])
-        st.divider()
-
-    if result.get("health"):
-        render_health(result["health"])
+    # One tab per agent that produced output
+    present = [name for name in _AGENT_RENDERERS if result.get(name)]
+    if present:
+        tabs = st.tabs([f"{_AGENT_ICONS[name]} {name.title()}" for name in present])
+        for tab, name in zip(tabs, present):
+            with tab:
+                _agent_panel(name, result[name], key, digest)
         st.divider()
 
     # Conflicts
@@ -578,17 +819,79 @@ if "messages" not in st.session_state:
 st.markdown("# 🤖 AI Smart Assistant")
 st.caption("Multi-agent orchestrator — Travel ✈️ · Finance 💰 · Health 🩺")
 
+
+def _add_message(role: str, content) -> str:
+    """Append a chat turn with a stable id and a content hash computed once; returns the id.
+
+    The hash keys `_memo_html`, so repeated identical answers reuse their rendered HTML.
+    """
+    digest = hashlib.blake2b(_dumps(content, sort_keys=True).encode(), digest_size=8)
+    msg_id = os.urandom(4).hex()
+    st.session_state.messages.append(
+        {"id": msg_id, "role": role, "content": content, "hash": digest.hexdigest()}
+    )
+    return msg_id
+
+
+def _lines(txt: str) -> list[str]:
+    return [l.strip() for l in (txt or "").splitlines() if l.strip()]
+
+
+_PROFILE_KEYS = (
+    "s_start", "s_end", "s_budget", "s_cur", "s_style", "s_pace",
+    "s_constraints", "s_diet", "s_limit", "s_risk", "s_horizon", "s_urls",
+)
+
+
+def _sidebar_profile() -> tuple[dict, list[str]]:
+    """Profile fields + seed URLs from the sidebar, rebuilt only when a widget value changed."""
+    ss = st.session_state
+    sig = tuple(ss.get(k) for k in _PROFILE_KEYS)
+    if ss.get("_profile_sig") != sig:
+        fields = {
+            "user_id": "u1",
+            "locale": "en-US",
+            "dates": {
+                "start": str(ss.get("s_start", "")),
+                "end": str(ss.get("s_end", "")),
+            },
+            "budget": {
+                "currency": ss.get("s_cur", "USD"),
+                "max_total": ss.get("s_budget", 1200),
+            },
+            "preferences": {
+                "style": ss.get("s_style", ""),
+                "pace": ss.get("s_pace", ""),
+            },
+            "constraints": _lines(ss.get("s_constraints", "")),
+            "health_notes": {
+                "dietary": _lines(ss.get("s_diet", "")),
+                "limitations": _lines(ss.get("s_limit", "")),
+            },
+            "finance_notes": {
+                "risk_tolerance": ss.get("s_risk", "medium"),
+                "time_horizon_years": ss.get("s_horizon", 5),
+            },
+        }
+        ss["_profile_cached"] = (fields, _lines(ss.get("s_urls", "")))
+        ss["_profile_sig"] = sig
+    return ss["_profile_cached"]
+
+
 # Display chat history
-for msg in st.session_state.messages:
-    with st.chat_message(msg["role"], avatar="🧑" if msg["role"] == "user" else "🤖"):
-        if msg["role"] == "user":
-            st.markdown(msg["content"])
-        else:
+@st.fragment
+def _render_history():
+    """Past turns; widgets inside a result rerun only this fragment."""
+    for msg in st.session_state.messages:
+        with st.chat_message(msg["role"], avatar="🧑" if msg["role"] == "user" else "🤖"):
             if isinstance(msg["content"], dict):
-                render_result(msg["content"])
+                render_result(msg["content"], msg["id"], msg.get("hash"))
             else:
                 st.markdown(msg["content"])
 
+
+_render_history()
+
 # Handle example query button
 if "example_query" in st.session_state:
     query = st.session_state.pop("example_query")
@@ -601,42 +904,14 @@ query = user_input or pending
 
 if query:
     # Add user message
-    st.session_state.messages.append({"role": "user", "content": query})
+    _add_message("user", query)
     with st.chat_message("user", avatar="🧑"):
         st.markdown(query)
 
-    # Build profile
-    def _lines(txt: str) -> list[str]:
-        return [l.strip() for l in (txt or "").splitlines() if l.strip()]
-
-    profile = {
-        "user_id": "u1",
-        "locale": "en-US",
-        "message": query,
-        "dates": {
-            "start": str(st.session_state.get("s_start", "")),
-            "end": str(st.session_state.get("s_end", "")),
-        },
-        "budget": {
-            "currency": st.session_state.get("s_cur", "USD"),
-            "max_total": st.session_state.get("s_budget", 1200),
-        },
-        "preferences": {
-            "style": st.session_state.get("s_style", ""),
-            "pace": st.session_state.get("s_pace", ""),
-        },
-        "constraints": _lines(st.session_state.get("s_constraints", "")),
-        "health_notes": {
-            "dietary": _lines(st.session_state.get("s_diet", "")),
-            "limitations": _lines(st.session_state.get("s_limit", "")),
-        },
-        "finance_notes": {
-            "risk_tolerance": st.session_state.get("s_risk", "medium"),
-            "time_horizon_years": st.session_state.get("s_horizon", 5),
-        },
-    }
+    # Build profile (sidebar part reused until a setting changes)
+    sidebar_fields, seed_urls = _sidebar_profile()
+    profile = {**sidebar_fields, "message": query}
 
-    seed_urls = _lines(st.session_state.get("s_urls", ""))
     provider = st.session_state.get("s_llm", "groq")
     model = st.session_state.get("s_model", "") or DEFAULT_MODELS.get(provider, "llama-3.3-70b-versatile")
     api_key = st.session_state.get("s_api_key", "") or os.environ.get("GROQ_API_KEY") or os.environ.get("LLM_API_KEY")
@@ -644,33 +919,50 @@ if query:
 
     if not api_key and provider != "stub":
         st.warning("⚠️ Please enter your API key in the sidebar under **LLM Settings → 🔑 API Key**.")
-        return
+        st.stop()
 
     # Run orchestrator
     with st.chat_message("assistant", avatar="🤖"):
         # Show classified agents
         active_agents = classify_query(query)
-        icons = {"travel": "✈️", "financial": "💰", "health": "🩺"}
-        agent_str = ", ".join(f"{icons.get(a, '🤖')} {a.title()}" for a in active_agents)
+        agent_str = ", ".join(f"{_AGENT_ICONS.get(a, '🤖')} {a.title()}" for a in active_agents)
         status_placeholder = st.empty()
         status_placeholder.info(f"🔍 Routing to: {agent_str}")
 
         with st.spinner("⏳ Running AI agents…"):
             try:
-                result = run_async(orchestrate(
-                    user_profile=profile,
-                    allowed_domains=DOMAINS,
-                    seed_urls=seed_urls,
-                    retrieval_budget_k=12,
-                    llm_provider=provider,
-                    llm_base_url=base_url,
-                    llm_api_key=api_key,
-                    llm_model=model,
-                ))
+                key = _result_key(profile, seed_urls, provider, model, base_url, api_key)
+                result = _cached_result(key)
+                if result is None:
+                    # Show each agent's card as soon as it finishes; the full layout replaces them
+                    partial = st.empty()
+                    finished: list[tuple[str, dict]] = []
+                    for name, out in stream_async(orchestrate_stream(
+                        user_profile=profile,
+                        allowed_domains=DOMAINS,
+                        seed_urls=seed_urls,
+                        retrieval_budget_k=12,
+                        llm_provider=provider,
+                        llm_base_url=base_url,
+                        llm_api_key=api_key,
+                        llm_model=model,
+                        active_agents=active_agents,
+                        http_client=get_http_client(),
+                    )):
+                        if name == "result":
+                            result = out
+                        elif name in _AGENT_RENDERERS:
+                            finished.append((name, out))
+                            with partial.container():
+                                for done_name, done_out in finished:
+                                    _AGENT_RENDERERS[done_name](done_out)
+                                    st.divider()
+                    partial.empty()
+                    _store_result(key, result)
                 status_placeholder.empty()
-                render_result(result)
-                st.session_state.messages.append({"role": "assistant", "content": result})
+                msg_id = _add_message("assistant", result)
+                render_result(result, msg_id, st.session_state.messages[-1]["hash"])
             except Exception as e:
                 status_placeholder.empty()
                 st.error(f"Error: {e}")
-                st.session_state.messages.append({"role": "assistant", "content": f"Error: {e}"})
+                _add_message("assistant", f"Error: {e}")